@@ -0,0 +1,37 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Offline benchmarks of the agent against a simulated fleet of nodes.
+
+Agent configs are read from the environment on import, so defaults for a standalone
+run (embedded SQLite database in a temporary folder, no MySQL or Ganache) are set
+before any agent module is imported.
+"""
+
+import os
+import tempfile
+
+WORK_FOLDER = os.environ.get('BENCHMARK_WORK_FOLDER') or tempfile.mkdtemp(prefix='sla-bench-')
+
+os.environ.setdefault('ENV', 'DEV')
+os.environ.setdefault('ENDPOINT', 'http://127.0.0.1:8545')
+os.environ.setdefault('DB_BACKEND', 'sqlite')
+os.environ.setdefault('DB_SQLITE_FILEPATH', os.path.join(WORK_FOLDER, 'sla_agent.db'))
+os.environ.setdefault('METRICS_ENABLED', 'False')
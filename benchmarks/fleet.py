@@ -0,0 +1,196 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Simulated fleet of nodes: fake SKALE Manager getters, watchdog and s-chain JSON-RPC
+servers and ping backend.
+
+Every target gets its own loopback address (127.x.y.z), servers listen on all
+addresses and find the target by the address a request came to. Latency and failure
+rate of every target are drawn around the fleet-wide values, so some targets are
+slower or less reliable than others.
+"""
+
+import asyncio
+import random
+import socket
+import threading
+import time
+from collections import namedtuple
+
+from aiohttp import web
+
+from configs import PING_COUNT, PING_INTERVAL, WATCHDOG_PORT, WATCHDOG_URL
+from tools.metrics import get_schains_for_node
+
+NODE_BASE_PORT = 10000
+REWARD_PERIOD = 30 * 24 * 3600
+CONTAINERS = ('skale_admin', 'skale_api', 'skale_mysql', 'skale_sla', 'skale_bounty',
+              'skale_watchdog', 'skale_transaction-manager')
+
+Profile = namedtuple('Profile', ['ping_latency', 'ping_loss', 'latency', 'failure_rate'])
+
+
+def target_ip(index):
+    return f'127.{1 + index // 62500}.{index // 250 % 250}.{index % 250 + 1}'
+
+
+class Fleet:
+    def __init__(self, size, schains=2, ping_latency=0.001, ping_loss=0.0, latency=0.005,
+                 failure_rate=0.0, ping_interval=PING_INTERVAL, seed=0):
+        self.schains = schains
+        self.ping_interval = ping_interval
+        self.created_at = int(time.time())
+        # Node 0 is the agent itself
+        self.nodes = [{'id': node_id, 'ip': target_ip(node_id)} for node_id in range(1, size + 1)]
+        rng = random.Random(seed)
+        self.profiles = {
+            node['ip']: Profile(ping_latency * rng.uniform(0.5, 1.5), ping_loss,
+                                latency * rng.uniform(0.5, 1.5),
+                                min(failure_rate * rng.uniform(0.5, 1.5), 1))
+            for node in self.nodes
+        }
+        self.random = random.Random(seed + 1)
+
+    def is_failed(self, profile):
+        return self.random.random() < profile.failure_rate
+
+    async def ping(self, host, count=PING_COUNT, timeout=None) -> dict:
+        """Same as tools.ping.ping_host, without network."""
+        profile = self.profiles.get(host, Profile(0.0001, 0, 0, 0))
+        await asyncio.sleep((count - 1) * self.ping_interval + profile.ping_latency)
+        if self.random.random() < profile.ping_loss:
+            return {'is_offline': True, 'latency': -1}
+        return {'is_offline': False, 'latency': int(profile.ping_latency * 1e6)}
+
+
+class FakeNodes:
+    def __init__(self, fleet):
+        self.fleet = fleet
+
+    def get(self, node_id):
+        ip = '127.0.0.1' if node_id == 0 else target_ip(node_id)
+        return {'name': f'node-{node_id}', 'ip': socket.inet_aton(ip), 'port': NODE_BASE_PORT,
+                'last_reward_date': self.fleet.created_at}
+
+    def get_nodes_number(self):
+        return len(self.fleet.nodes) + 1
+
+
+class FakeSchains:
+    def __init__(self, fleet):
+        self.fleet = fleet
+
+    def get_active_schains_for_node(self, node_id):
+        return [{'name': f'schain-{(node_id + index) % 100}', 'index': index}
+                for index in range(self.fleet.schains)]
+
+
+class FakeConstantsHolder:
+    def get_reward_period(self):
+        return REWARD_PERIOD
+
+
+class FakeTxResult:
+    receipt = {'status': 1}
+
+
+class FakeManager:
+    def __init__(self):
+        self.verdicts = []
+
+    def send_verdicts(self, node_id, verdicts):
+        self.verdicts.extend(verdicts)
+        return FakeTxResult()
+
+
+class FakeSkale:
+    """SKALE Manager getters used by the agent, answered from the fleet."""
+
+    def __init__(self, fleet):
+        self.nodes = FakeNodes(fleet)
+        self.schains = FakeSchains(fleet)
+        self.constants_holder = FakeConstantsHolder()
+        self.manager = FakeManager()
+
+
+class FleetServers:
+    """Watchdog and s-chain servers of all targets, running on their own event loop."""
+
+    def __init__(self, fleet, skale, host='0.0.0.0'):
+        self.fleet = fleet
+        self.host = host
+        self.ports = sorted({schain['http_rpc_port']
+                             for schain in get_schains_for_node(skale, fleet.nodes[0]['id'])})
+        self.block_number = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='fleet-servers',
+                                        daemon=True)
+        self._runners = []
+
+    def get_profile(self, request):
+        address = request.transport.get_extra_info('sockname')[0]
+        return self.fleet.profiles.get(address, Profile(0, 0, 0, 0))
+
+    async def watchdog(self, request):
+        profile = self.get_profile(request)
+        await asyncio.sleep(profile.latency)
+        if self.fleet.is_failed(profile):
+            return web.Response(status=500)
+        containers = [{'name': name, 'state': {'Running': True, 'Paused': False,
+                                               'Health': {'Status': 'healthy'}}}
+                      for name in CONTAINERS]
+        return web.json_response({'data': containers, 'error': None})
+
+    async def schain_rpc(self, request):
+        profile = self.get_profile(request)
+        await asyncio.sleep(profile.latency)
+        if self.fleet.is_failed(profile):
+            return web.json_response({'jsonrpc': '2.0', 'id': 1,
+                                      'error': {'code': -32000, 'message': 'Failed'}})
+        self.block_number += 1
+        return web.json_response({'jsonrpc': '2.0', 'id': 1, 'result': hex(self.block_number)})
+
+    async def _start_app(self, app, port):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, port, backlog=1024).start()
+        self._runners.append(runner)
+
+    async def _start(self):
+        watchdog_app = web.Application()
+        watchdog_app.router.add_get(f'/{WATCHDOG_URL}', self.watchdog)
+        await self._start_app(watchdog_app, int(WATCHDOG_PORT))
+        for port in self.ports:
+            schain_app = web.Application()
+            schain_app.router.add_post('/', self.schain_rpc)
+            await self._start_app(schain_app, port)
+
+    async def _stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,246 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Runs monitor passes and report sending of SlaAgent against simulated fleets.
+
+Usage: python -m benchmarks.run --fleet 24,100,500,2000
+
+Every result is appended to the history file and compared with the previous result
+of the same fleet and settings, a metric that got worse by more than threshold is
+reported as a regression.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from unittest import mock
+
+from benchmarks import WORK_FOLDER
+from benchmarks.fleet import REWARD_PERIOD, FakeSkale, Fleet, FleetServers
+from configs import MONITOR_CONCURRENCY, PING_INTERVAL, VERDICTS_LEDGER_FILEPATH
+from sla_agent import SlaAgent
+from tools import db, tracing
+from tools.cache import skale_cache
+from tools.connectivity import connectivity
+from tools.planner import ProbePlanner
+from tools.verdicts import VerdictLedger
+
+HISTORY_FILEPATH = os.path.join(os.path.dirname(__file__), 'history.jsonl')
+# Probe, ping, watchdog and s-chain spans
+SPANS_PER_TARGET = 8
+COMPARED_METRICS = ('pass_p50', 'probe_p99', 'report_duration')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SLA agent benchmark on a simulated fleet')
+    parser.add_argument('--fleet', default='24,100,500,2000',
+                        help='comma separated fleet sizes (number of targets)')
+    parser.add_argument('--passes', type=int, default=3, help='monitor passes per fleet')
+    parser.add_argument('--schains', type=int, default=2, help='s-chains per node')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='watchdog and s-chain response time, seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.01,
+                        help='share of failed watchdog and s-chain requests')
+    parser.add_argument('--ping-latency', type=float, default=0.001, help='ping RTT, seconds')
+    parser.add_argument('--ping-loss', type=float, default=0.01, help='share of lost pings')
+    parser.add_argument('--ping-interval', type=float, default=PING_INTERVAL,
+                        help='interval between pings of one host, seconds')
+    parser.add_argument('--concurrency', type=int, default=MONITOR_CONCURRENCY,
+                        help='nodes probed at once')
+    parser.add_argument('--report-samples', type=int, default=24,
+                        help='reports per target stored for the epoch before sending reports')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=HISTORY_FILEPATH, help='results history file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='exit with code 1 if any regression is found')
+    parser.add_argument('--log-level', default='CRITICAL',
+                        help='agent log level, failed checks are logged as errors')
+    return parser.parse_args(argv)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[max(math.ceil(q * len(values)) - 1, 0)] if values else None
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_config(args) -> dict:
+    return {name: getattr(args, name) for name in
+            ('passes', 'schains', 'latency', 'failure_rate', 'ping_latency', 'ping_loss',
+             'ping_interval', 'concurrency', 'report_samples', 'seed')}
+
+
+async def always_online():
+    return True
+
+
+def create_agent(skale):
+    with mock.patch('sla_agent.init_agent_logger'):
+        agent = SlaAgent(skale, node_id=0)
+    # Agent created with node id runs in test mode, which pings the local host only
+    agent.is_test_mode = False
+    return agent
+
+
+def store_epoch_reports(fleet, samples):
+    """Saves `samples` reports per target evenly spread over the last epoch."""
+    now = datetime.utcnow().timestamp()
+    rows = [{'my_id': 0, 'target_id': node['id'], 'is_offline': False, 'latency': 1000,
+             'stamp': datetime.utcfromtimestamp(now - REWARD_PERIOD * (i + 0.5) / samples)
+             .replace(microsecond=0)}
+            for node in fleet.nodes for i in range(samples)]
+    if rows:
+        db.save_reports_to_db(rows)
+
+
+def run_fleet(size, args) -> dict:
+    fleet = Fleet(size, args.schains, args.ping_latency, args.ping_loss, args.latency,
+                  args.failure_rate, args.ping_interval, args.seed)
+    skale = FakeSkale(fleet)
+    skale_cache.invalidate()
+    db.clear_all_reports()
+    servers = FleetServers(fleet, skale)
+    servers.start()
+    bench_tracer = tracing.Tracer(size=size * SPANS_PER_TARGET + 1000,
+                                  slow_threshold=float('inf'))
+    pass_durations, probe_durations = [], []
+    try:
+        with mock.patch.object(tracing, 'tracer', bench_tracer), \
+                mock.patch('sla_agent.MONITOR_CONCURRENCY', args.concurrency), \
+                mock.patch('tools.metrics.ping_host', fleet.ping), \
+                mock.patch('tools.helper.Notifier._post', return_value=0), \
+                mock.patch.object(connectivity, 'is_online', return_value=True), \
+                mock.patch.object(connectivity, 'refresh_async', always_online), \
+                mock.patch.object(connectivity, 'was_offline_during', return_value=False):
+            agent = create_agent(skale)
+            for _ in range(args.passes):
+                # Fresh plan, so that every target is due in every pass
+                agent.planner = ProbePlanner()
+                start = time.monotonic()
+                with bench_tracer.trace('benchmark_pass') as root:
+                    agent.check_nodes(skale, fleet.nodes)
+                pass_durations.append(time.monotonic() - start)
+                probe_durations.extend(span.duration
+                                       for span in bench_tracer.get_spans(root.trace_id)
+                                       if span.name == 'probe_node')
+
+            store_epoch_reports(fleet, args.report_samples)
+            if os.path.exists(VERDICTS_LEDGER_FILEPATH):
+                os.remove(VERDICTS_LEDGER_FILEPATH)
+            agent.verdict_ledger = VerdictLedger()
+            nodes_for_report = [{'id': node['id'], 'rep_date': int(time.time())}
+                                for node in fleet.nodes]
+            start = time.monotonic()
+            agent.send_reports(skale, nodes_for_report)
+            report_duration = time.monotonic() - start
+    finally:
+        servers.stop()
+
+    pass_p50 = percentile(pass_durations, 0.5)
+    return {
+        'fleet': size,
+        'pass_p50': pass_p50,
+        'pass_max': max(pass_durations),
+        'throughput': size / pass_p50,
+        'probe_p50': percentile(probe_durations, 0.5),
+        'probe_p99': percentile(probe_durations, 0.99),
+        'report_duration': report_duration,
+        'verdicts': len(skale.manager.verdicts)
+    }
+
+
+def load_history(filepath) -> list:
+    if not os.path.exists(filepath):
+        return []
+    with open(filepath) as history_file:
+        return [json.loads(line) for line in history_file if line.strip()]
+
+
+def find_baseline(history, result):
+    return next((entry for entry in reversed(history)
+                 if entry['fleet'] == result['fleet'] and entry['config'] == result['config']),
+                None)
+
+
+def find_regressions(result, baseline, threshold) -> list:
+    if baseline is None:
+        return []
+    return [metric for metric in COMPARED_METRICS
+            if baseline.get(metric) and result[metric] > baseline[metric] * (1 + threshold)]
+
+
+def format_change(result, baseline, metric):
+    if baseline is None or not baseline.get(metric):
+        return '-'
+    return f'{(result[metric] / baseline[metric] - 1) * 100:+.0f}%'
+
+
+def print_result(result, baseline, regressions):
+    print(f'{result["fleet"]:>6} | {result["pass_p50"]:8.2f}s | {result["pass_max"]:8.2f}s | '
+          f'{result["throughput"]:9.1f} | {result["probe_p50"] * 1000:8.1f}ms | '
+          f'{result["probe_p99"] * 1000:8.1f}ms | {result["report_duration"]:7.2f}s | '
+          f'{format_change(result, baseline, "pass_p50"):>6} '
+          f'{"REGRESSION: " + ", ".join(regressions) if regressions else ""}')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    history_filepath = os.path.abspath(args.history)
+    history = load_history(history_filepath)
+    commit = get_commit()
+    os.chdir(WORK_FOLDER)
+    db.migrate_db()
+    found_regressions = False
+
+    print(f'{"fleet":>6} | {"pass p50":>9} | {"pass max":>9} | {"targets/s":>9} | '
+          f'{"probe p50":>10} | {"probe p99":>10} | {"report":>8} | change')
+    for size in [int(size) for size in args.fleet.split(',')]:
+        result = run_fleet(size, args)
+        result.update({'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+                       'commit': commit, 'config': get_config(args)})
+        baseline = find_baseline(history, result)
+        regressions = find_regressions(result, baseline, args.threshold)
+        found_regressions = found_regressions or bool(regressions)
+        print_result(result, baseline, regressions)
+        with open(history_filepath, 'a') as history_file:
+            history_file.write(json.dumps(result) + '\n')
+
+    if found_regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
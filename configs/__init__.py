@@ -6,6 +6,12 @@ LONG_LINE = '-' * 100
 LONG_DOUBLE_LINE = '=' * 100
 
 NOTIFIER_URL = 'http://localhost:3007/send-tg-notification'
+NOTIFIER_TIMEOUT = 10
+NOTIFIER_FLUSH_INTERVAL = 5
+NOTIFIER_QUEUE_SIZE = 1000
+NOTIFIER_RATE_LIMIT = 20  # messages per minute
+NOTIFIER_DEDUP_WINDOW = 600
+NOTIFIER_MAX_LINES = 30
 SKALE_VOLUME_PATH = '/skale_vol'
 NODE_DATA_PATH = '/skale_node_data'
 
@@ -16,13 +22,97 @@ NODE_CONFIG_FILENAME = 'node_config.json'
 NODE_CONFIG_FILEPATH = os.path.join(NODE_DATA_PATH, NODE_CONFIG_FILENAME)
 
 GOOD_IP = '127.0.0.1' if ENV == 'DEV' else '8.8.8.8'
+# GOOD_IP port for TCP connect probes when ICMP is not available (DNS over TCP)
+CONNECTIVITY_TCP_PORT = 53
 MONITOR_PERIOD = 60
+# Monitor period is split into slots, every target is sampled once per period in its slot
+PROBE_SLOTS = 6
+# Connectivity is checked at the start of a pass and when probes fail, at most once per
+# this number of seconds, i.e. at most 10 times per slot
+CONNECTIVITY_TTL = MONITOR_PERIOD * 60 // PROBE_SLOTS // 10
+# Number of recent probes a target has to pass to be considered stable
+PROBE_STABLE_WINDOW = 6
+# Targets that didn't answer ping this many probes in a row are only pinged until they do
+BREAKER_FAILURE_THRESHOLD = 2 * PROBE_SLOTS
+# Monitor pass has to finish within its slot, probes still running after that are cut off
+MONITOR_PASS_TIMEOUT = MONITOR_PERIOD * 60 // PROBE_SLOTS - 30
 REPORT_PERIOD = 15
-SENT_VERDICTS_FILEPATH = 'sent_verdicts.json'
+VERDICTS_LEDGER_FILEPATH = 'sent_verdicts.jsonl'
+# Sent verdicts are kept for this number of epochs
+VERDICTS_RETENTION_EPOCHS = 3
 MONITORED_NODES_FILEPATH = 'monitored_nodes.json'
 MONITORED_NODES_COUNT = 24
 CONFIG_CHECK_PERIOD = 30
+
+RPC_TIMEOUT = 10
+RPC_BATCH_SIZE = 100
+RPC_BATCH_RETRIES = 3
+RPC_BATCH_WAIT = 2
+# SKALE Manager calls are retried until attempts or this time (seconds) run out
+CALL_RETRY_ATTEMPTS = 10
+CALL_RETRY_WAIT = 2
+CALL_RETRY_BUDGET = 60
+
+# TTLs (seconds) and max age (blocks) of cached SKALE Manager reads
+SKALE_CACHE_TTLS = {
+    'nodes.get': 3600,
+    'nodes.last_reward_date': 300,
+    'schains.get_active_schains_for_node': 600
+}
+SKALE_CACHE_MAX_BLOCKS = {
+    'nodes.last_reward_date': 20,
+    'schains.get_active_schains_for_node': 40
+}
 WATCHDOG_TIMEOUT = 10
+WATCHDOG_CONNECT_TIMEOUT = 3
+WATCHDOG_READ_TIMEOUT = 7
+WATCHDOG_CONNECTIONS_PER_HOST = 2
+WATCHDOG_MAX_CONNECTIONS = 100
+WATCHDOG_CONDITIONAL_REQUESTS = True
+
+MONITOR_CONCURRENCY = 8
+# Number of per-check samples kept in memory
+CHECK_SAMPLES_CAPACITY = 100000
+# Number of the slowest checks logged after every monitor pass
+CHECK_SUMMARY_SLOWEST = 5
+
+# Spans kept for tracing, traces of monitor passes longer than threshold (seconds) are logged
+TRACE_BUFFER_SIZE = 10000
+TRACE_SLOW_THRESHOLD = 60
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9122))
+NODE_CHECK_TIMEOUT = 60
+
+SCHAIN_CHECK_TIMEOUT = 10
+SCHAIN_CLIENT_MAX_CONNECTIONS = 256
+# Targets are probed at least once per period, so keep-alive connections are kept a bit
+# longer than that to be reused by the next probe
+CLIENT_IDLE_TTL = MONITOR_PERIOD * 60 + MONITOR_PERIOD * 60 // PROBE_SLOTS
+SCHAIN_CLIENT_IDLE_TTL = CLIENT_IDLE_TTL
+SCHAIN_CLIENT_CONNECTIONS = 2
 
 WATCHDOG_URL = 'status/core'
 WATCHDOG_PORT = '3009'
+
+PING_COUNT = 3
+PING_INTERVAL = 0.2
+PING_TIMEOUT = 1
+TCP_PING_PORT = int(WATCHDOG_PORT)
+
+# Latency budget (seconds) of one node probe, shared by checks in these proportions
+PROBE_BUDGET = 30
+PROBE_BUDGET_SHARES = {'ping': 0.2, 'watchdog': 0.35, 'schain': 0.45}
+# Check timeout is p95 of its recent durations on the host times factor, within its share
+PROBE_TIMEOUT_FACTOR = 3
+# Ping minimum leaves time for one lost echo, which doesn't make the host offline, slow
+# watchdog and s-chain answers are not downtime, so they keep their usual timeouts
+PROBE_TIMEOUT_MIN = {
+    'ping': (PING_COUNT - 1) * PING_INTERVAL + 2 * PING_TIMEOUT,
+    'watchdog': WATCHDOG_TIMEOUT,
+    'schain': SCHAIN_CHECK_TIMEOUT
+}
+# Durations kept per check type and host, and needed before timeouts adapt to them
+PROBE_RTT_HISTORY = 50
+PROBE_RTT_MIN_SAMPLES = 5
@@ -1,7 +1,50 @@
 import os
 
+from configs import NODE_DATA_PATH
+
+# Storage backend: 'mysql' (separate container) or 'sqlite' (embedded)
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql')
+
 DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
-DB_PORT = int(os.environ.get("DB_PORT"))
+DB_PORT = int(os.environ.get("DB_PORT", 3306))
 DB_NAME = 'db_skale'
 DB_HOST = '127.0.0.1'
+DB_CONNECT_TIMEOUT = 10
+
+# Node data folder if it's writable (inside the container), working folder otherwise
+DB_SQLITE_FILEPATH = os.environ.get(
+    'DB_SQLITE_FILEPATH',
+    os.path.join(NODE_DATA_PATH if os.access(NODE_DATA_PATH, os.W_OK) else '', 'sla_agent.db'))
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'wal'),
+    ('synchronous', 'normal'),
+    ('cache_size', -16 * 1024),
+    ('temp_store', 'memory'),
+    ('busy_timeout', 10000),
+)
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_POOL_WAIT_TIMEOUT = 10
+DB_STALE_TIMEOUT = 300
+DB_RECYCLE_PERIOD = 10
+
+REPORT_BUFFER_SIZE = 500
+REPORT_BUFFER_MAX_AGE = 300
+INSERT_CHUNK_SIZE = 1000
+REPORTS_SPILL_FILEPATH = 'reports_spill.jsonl'
+
+# Rollup bucket lengths in seconds, the shortest one must divide the longest
+ROLLUP_PERIODS = (3600, 86400)
+
+# Raw reports and hourly rollups are kept for this number of reward periods
+REPORTS_RETENTION_EPOCHS = 2
+# Daily rollups are kept for this number of reward periods
+ROLLUPS_RETENTION_EPOCHS = 12
+RETENTION_BATCH_SIZE = 5000
+RETENTION_BATCH_PAUSE = 0.5
+RETENTION_PERIOD = 6
+REPORTS_ARCHIVE_FOLDER = os.environ.get('REPORTS_ARCHIVE_FOLDER')
+
+DB_PARTITION_REPORTS = os.environ.get('DB_PARTITION_REPORTS') == 'True'
+PARTITION_DAYS_AHEAD = 3
@@ -6,9 +6,24 @@ CREATE TABLE `report` (
   `is_offline` tinyint(1) unsigned NULL,
   `latency` int NULL,
   `stamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  KEY `report_my_id_target_id_stamp_is_offline_latency` (`my_id`, `target_id`, `stamp`, `is_offline`, `latency`)
 ) ENGINE=InnoDB AUTO_INCREMENT=25158 DEFAULT CHARSET=utf8;
 
+CREATE TABLE `report_rollup` (
+  `id` int unsigned NOT NULL AUTO_INCREMENT,
+  `my_id` int NOT NULL,
+  `target_id` int NOT NULL,
+  `period` int NOT NULL,
+  `bucket` datetime NOT NULL,
+  `offline_count` int NOT NULL DEFAULT 0,
+  `latency_sum` bigint NOT NULL DEFAULT 0,
+  `latency_count` int NOT NULL DEFAULT 0,
+  `sample_count` int NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `reportrollup_my_id_target_id_period_bucket` (`my_id`, `target_id`, `period`, `bucket`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 CREATE TABLE `report_event` (
   `id` int unsigned NOT NULL AUTO_INCREMENT,
   `my_id` int unsigned NULL,
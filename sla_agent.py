@@ -22,30 +22,45 @@ SLA agent runs on every node of SKALE network, periodically gets a list of nodes
 from SKALE Manager (SM), checks its health metrics and sends transactions with average metrics to SM
 when it's time to send it
 """
-# import concurrent.futures
 import json
 import logging
 import random
 import socket
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from apscheduler.schedulers.background import BackgroundScheduler
 from skale.skale_manager import spawn_skale_manager_lib
 from skale.transactions.result import TransactionError
 
-from configs import (GOOD_IP, LONG_LINE, MONITOR_PERIOD, MONITORED_NODES_COUNT,
-                     MONITORED_NODES_FILEPATH, NODE_CONFIG_FILEPATH,
-                     REPORT_PERIOD, SENT_VERDICTS_FILEPATH)
-from tools import db
+from configs import (GOOD_IP, LONG_LINE, METRICS_ENABLED, MONITOR_CONCURRENCY,
+                     MONITOR_PASS_TIMEOUT, MONITOR_PERIOD, MONITORED_NODES_COUNT,
+                     MONITORED_NODES_FILEPATH, NODE_CHECK_TIMEOUT, NODE_CONFIG_FILEPATH,
+                     PROBE_SLOTS, REPORT_PERIOD, VERDICTS_RETENTION_EPOCHS)
+from configs.db import (DB_PARTITION_REPORTS, DB_RECYCLE_PERIOD, REPORTS_ARCHIVE_FOLDER,
+                        REPORTS_RETENTION_EPOCHS, RETENTION_PERIOD, ROLLUP_PERIODS,
+                        ROLLUPS_RETENTION_EPOCHS)
+from tools import db, retention
+from tools.cache import skale_cache
+from tools.connectivity import connectivity
+from tools.exceptions import NoInternetConnectionException, PassDeadlineException
+from tools.exporter import (NOTIFIER_QUEUE_DEPTH, OPEN_BREAKERS, PASS_DURATION, PASS_EVENTS,
+                            start_http_server)
 from tools.helper import (MsgIcon, Notifier, call_retry,
                           check_if_node_is_registered, get_agent_name,
                           get_id_from_config, init_skale)
 from tools.logger import init_agent_logger
-from tools.metrics import get_metrics_for_node, get_ping_node_results
+from tools.metrics import get_metrics_for_nodes
+from tools.planner import ProbePlanner
+from tools.rpc import get_active_node_ids, get_node_ips
+from tools.samples import check_samples, export_summary, format_summary, observe_checks
+from tools.tracing import traced_retry, tracer
+from tools.verdicts import VerdictLedger
 
 DISABLE_REPORTING = True
+MONITOR_JOB_ID = 'monitor'
 
 
 class SlaAgent:
@@ -71,33 +86,42 @@ class SlaAgent:
         self.skale = skale
 
         check_if_node_is_registered(self.skale, self.id)
-        node_info = call_retry(self.skale.nodes.get, self.id)
+        node_info = traced_retry(call_retry, 'nodes.get', self.skale.nodes.get, self.id)
         self.notifier = Notifier(self.agent_name, node_info['name'],
                                  self.id, socket.inet_ntoa(node_info['ip']))
         self.nodes = []
-        self.reward_period = call_retry.call(self.skale.constants_holder.get_reward_period)
+        self.planner = ProbePlanner()
+        self.verdict_ledger = VerdictLedger()
+        self.monitor_lock = threading.Lock()
+        self.pass_stats = {'passes': 0, 'skipped': 0, 'overrun': 0,
+                           'timed_out_probes': 0, 'deferred_probes': 0}
+        self.reward_period = traced_retry(call_retry, 'constants_holder.get_reward_period',
+                                          self.skale.constants_holder.get_reward_period)
         self.scheduler = BackgroundScheduler(timezone='UTC')
+        NOTIFIER_QUEUE_DEPTH.set_function(self.notifier.queue_depth)
+        OPEN_BREAKERS.set_function(lambda: self.planner.count_open_breakers())
         self.notifier.send(f'{self.agent_name} started successfully with a node ID = {self.id}',
                            icon=MsgIcon.INFO)
 
     def get_last_reward_date(self):
-        node_info = call_retry(self.skale.nodes.get, self.id)
+        return skale_cache.get('nodes.last_reward_date', self.fetch_last_reward_date)
+
+    def fetch_last_reward_date(self):
+        # The call is counted by skale_cache as nodes.last_reward_date
+        node_info = traced_retry(call_retry, 'nodes.get', self.skale.nodes.get, self.id,
+                                 skale_call=False)
         return node_info['last_reward_date']
 
     def generate_monitored_array(self):
-        active_ids = self.skale.nodes.get_active_node_ids()
+        active_ids = get_active_node_ids(self.skale)
         active_ids.remove(self.id)
 
         if len(active_ids) <= MONITORED_NODES_COUNT:
             monitored_ids = active_ids
         else:
             monitored_ids = random.sample(active_ids, MONITORED_NODES_COUNT)
-        monitored_nodes = []
-        for id in monitored_ids:
-            node_info = call_retry(self.skale.nodes.get, id)
-            ip = socket.inet_ntoa(node_info['ip'])
-            monitored_nodes.append({'id': id, 'ip': ip})
-        return monitored_nodes
+        node_ips = get_node_ips(self.skale, monitored_ids)
+        return [{'id': id, 'ip': node_ips[id]} for id in monitored_ids]
 
     def save_monitored_array(self, monitored_nodes):
         with open(MONITORED_NODES_FILEPATH, 'w') as json_file:
@@ -109,6 +133,8 @@ class SlaAgent:
             with open(MONITORED_NODES_FILEPATH) as json_file:
                 data = json.load(json_file)
             if self.get_last_reward_date() > data['last_reward_date']:
+                # New epoch, s-chains could have been rotated
+                skale_cache.invalidate('schains.get_active_schains_for_node')
                 monitored_array = self.generate_monitored_array()
                 self.save_monitored_array(monitored_array)
             else:
@@ -121,32 +147,76 @@ class SlaAgent:
             self.save_monitored_array(monitored_array)
             return monitored_array
 
-    def check_nodes(self, skale, nodes):
-        """Validate nodes and returns a list of nodes to be reported."""
+    def check_nodes(self, skale, nodes, scheduled=False, deadline=None):
+        """
+        Validate nodes due for a probe concurrently and save their metrics to database.
+
+        Probes still running at deadline (monotonic time) are recorded as timeouts, nodes
+        not probed by then are left for the next pass.
+        """
         self.logger.info(LONG_LINE)
         if len(nodes) == 0:
             self.logger.info('No nodes for monitoring')
-        else:
-            self.logger.info(f'Number of nodes for monitoring: {len(nodes)}')
-            self.logger.info(f'Nodes for monitoring : {nodes}')
-
-        for node in nodes:
-            if not get_ping_node_results(GOOD_IP)['is_offline']:
-                metrics = get_metrics_for_node(skale, node, self.is_test_mode)
-                try:
-                    db.save_metrics_to_db(self.id, node['id'],
-                                          metrics['is_offline'], metrics['latency'])
-                except Exception as err:
-                    self.notifier.send(f'Cannot save metrics to database - '
-                                       f'is MySQL container running? {err}', icon=MsgIcon.ERROR)
-            else:
-                self.notifier.send(f'Cannot ping {GOOD_IP} - is network ok? '
-                                   f'Skipping monitoring node {node["id"]}', icon=MsgIcon.ERROR)
+            return
+        probes = self.planner.plan(nodes, scheduled)
+        if len(probes) == 0:
+            self.logger.info('No nodes to probe in this slot')
+            return
+        self.logger.info(f'Number of nodes for monitoring: {len(probes)} of {len(nodes)}')
+        self.logger.info(f'Nodes for monitoring : {[probe.node for probe in probes]}')
+
+        if not connectivity.is_online():
+            self.notifier.send(f'Cannot ping {GOOD_IP} - is network ok? '
+                               f'Skipping monitoring of {len(probes)} nodes', icon=MsgIcon.ERROR)
+            return
+
+        ping_only_ids = {probe.node['id'] for probe in probes if not probe.full_check}
+        gated_ids = {probe.node['id'] for probe in probes if probe.gated}
+        pass_timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        results = get_metrics_for_nodes(skale, [probe.node for probe in probes],
+                                        self.is_test_mode, MONITOR_CONCURRENCY,
+                                        NODE_CHECK_TIMEOUT, ping_only_ids, pass_timeout,
+                                        self.on_probe_result, gated_ids)
+        skipped = []
+        deferred = []
+        for probe in probes:
+            node = probe.node
+            metrics = results[node['id']]
+            if isinstance(metrics, NoInternetConnectionException):
+                skipped.append(node['id'])
+                continue
+            if isinstance(metrics, PassDeadlineException):
+                deferred.append(node['id'])
+                continue
+            if isinstance(metrics, Exception):
+                self.notifier.send(f'Failed to check node {node["id"]}: {metrics}',
+                                   icon=MsgIcon.ERROR)
+                continue
+            if metrics.get('timeout'):
+                self.count_pass_event('timed_out_probes')
+            # Latency is -1 when the node didn't answer ping
+            self.planner.update(probe, metrics['is_offline'], metrics['latency'] != -1)
+            if probe.record:
+                db.report_buffer.add(self.id, node['id'], metrics['is_offline'],
+                                     metrics['latency'])
+        try:
+            db.report_buffer.flush()
+        except Exception as err:
+            self.notifier.send(f'Cannot save metrics to database - '
+                               f'is MySQL container running? {err}', icon=MsgIcon.ERROR)
+        if skipped:
+            self.notifier.send(f'Lost connection to {GOOD_IP} during monitoring - '
+                               f'samples for nodes {skipped} were discarded', icon=MsgIcon.ERROR)
+        if deferred:
+            self.count_pass_event('deferred_probes', len(deferred))
+            self.logger.warning(f'Monitor pass deadline reached, nodes {deferred} '
+                                f'are left for the next pass')
 
     def get_reported_nodes(self, skale, nodes) -> list:
         """Returns a list of nodes to be reported."""
         last_block_number = skale.web3.eth.blockNumber
-        block_data = call_retry.call(skale.web3.eth.getBlock, last_block_number)
+        block_data = traced_retry(call_retry, 'eth.getBlock', skale.web3.eth.getBlock,
+                                  last_block_number)
         block_timestamp = datetime.utcfromtimestamp(block_data['timestamp'])
         self.logger.info(f'Timestamp of current block: {block_timestamp}')
 
@@ -160,82 +230,120 @@ class SlaAgent:
                 nodes_for_report.append({'id': node['id'], 'rep_date': node['rep_date']})
         return nodes_for_report
 
-    def save_verdicts(self, verdicts):
-        with open(SENT_VERDICTS_FILEPATH, 'w') as json_file:
-            json.dump({'verdicts': verdicts}, json_file)
-
-    def update_verdicts(self, verdicts):
-        try:
-            with open(SENT_VERDICTS_FILEPATH) as json_file:
-                data = json.load(json_file)
-            saved_verdicts = data['verdicts']
-            verdicts = [verdict for verdict in verdicts if list(verdict) not in saved_verdicts]
-        except FileNotFoundError:
-            self.logger.info('No verdicts file found')
-        self.save_verdicts(verdicts)
-        return verdicts
-
     def send_reports(self, skale, nodes_for_report):
-        """Send reports for every node from nodes_for_report."""
+        """Send reports for every node from nodes_for_report not reported on yet."""
         self.logger.info(LONG_LINE)
         err_status = 0
         verdicts = []
+        entries = []
+        nodes_by_rep_date = {}
         for node in nodes_for_report:
-            start_date = node['rep_date'] - self.reward_period
-            self.logger.info(f'Getting month metrics for node id = {node["id"]}:')
+            if self.verdict_ledger.is_sent(node['id'], node['rep_date']):
+                self.logger.info(f'Verdict for node id = {node["id"]} was already sent')
+                continue
+            nodes_by_rep_date.setdefault(node['rep_date'], []).append(node['id'])
+
+        for rep_date, node_ids in nodes_by_rep_date.items():
+            start_date = rep_date - self.reward_period
+            self.logger.info(f'Getting month metrics for nodes id = {node_ids}:')
             self.logger.info(f'Query start date: {datetime.utcfromtimestamp(start_date)}')
-            self.logger.info(f'Query end date: {datetime.utcfromtimestamp(node["rep_date"])}')
+            self.logger.info(f'Query end date: {datetime.utcfromtimestamp(rep_date)}')
             try:
-
-                metrics = db.get_month_metrics_for_node(self.id, node['id'],
-                                                        datetime.utcfromtimestamp(start_date),
-                                                        datetime.utcfromtimestamp(node['rep_date']))
+                metrics = db.get_month_metrics_for_nodes(self.id, node_ids,
+                                                         datetime.utcfromtimestamp(start_date),
+                                                         datetime.utcfromtimestamp(rep_date))
             except Exception as err:
-                self.notifier.send(f'Failed to get month metrics from db for node id = '
-                                   f'{node["id"]}: {err}', icon=MsgIcon.ERROR)
-            else:
-                self.logger.info(f'Epoch metrics for node id = {node["id"]}: {metrics}')
-                verdict = (node['id'], metrics['downtime'], metrics['latency'])
+                self.notifier.send(f'Failed to get month metrics from db for nodes id = '
+                                   f'{node_ids}: {err}', icon=MsgIcon.ERROR)
+                continue
+            for node_id in node_ids:
+                self.logger.info(f'Epoch metrics for node id = {node_id}: {metrics[node_id]}')
+                verdict = (node_id, metrics[node_id]['downtime'], metrics[node_id]['latency'])
                 verdicts.append(verdict)
+                entries.append((node_id, rep_date, verdict))
 
         if len(verdicts) != 0:
-            verdicts = self.update_verdicts(verdicts)
+            self.verdict_ledger.add_pending(entries)
             try:
                 tx_res = skale.manager.send_verdicts(self.id, verdicts)
             except TransactionError as err:
                 self.notifier.send(str(err), icon=MsgIcon.CRITICAL)
                 raise
+            self.verdict_ledger.mark_sent([(node_id, rep_date)
+                                           for node_id, rep_date, _ in entries])
 
             self.logger.info('The report was successfully sent')
             self.logger.info(f'Tx hash: {tx_res.receipt}')
         return err_status
 
-    def monitor_job(self) -> None:
+    def monitor_job(self, scheduled=False) -> None:
         """
         Periodic job for monitoring nodes.
+
+        Scheduled runs probe the nodes of the current slot, otherwise every node which
+        has no sample in the current period yet is probed. Only one pass runs at a time,
+        a pass started while the previous one is still running is skipped.
         """
+        if not self.monitor_lock.acquire(blocking=False):
+            self.count_pass_event('skipped')
+            self.logger.warning('Previous monitor pass is still running, skipping this one')
+            return
+        start = time.monotonic()
+        started_at = time.time()
         try:
-            self.logger.info('New monitor job started...')
-            skale = spawn_skale_manager_lib(self.skale)
-
-            if DISABLE_REPORTING:
-                self.nodes = self.get_monitored_array()
-            else:
-                try:
-                    self.nodes = call_retry.call(skale.monitors.get_checked_array, self.id)
-                except Exception as err:
-                    self.notifier.send(f'Failed to get list of monitored nodes. Error: {err}',
-                                       icon=MsgIcon.ERROR)
-                    self.logger.info('Monitoring nodes from previous job list')
-
-            self.check_nodes(skale, self.nodes)
-
-            self.logger.info(f'{threading.enumerate()}')
-            self.logger.info('Monitor job finished.')
+            with tracer.trace('monitor_pass', scheduled=scheduled):
+                self.logger.info('New monitor job started...')
+                skale = spawn_skale_manager_lib(self.skale)
+                skale_cache.set_block_number(skale.web3.eth.blockNumber)
+
+                if DISABLE_REPORTING:
+                    self.nodes = self.get_monitored_array()
+                else:
+                    try:
+                        self.nodes = traced_retry(call_retry, 'monitors.get_checked_array',
+                                                  skale.monitors.get_checked_array, self.id)
+                    except Exception as err:
+                        self.notifier.send(f'Failed to get list of monitored nodes. Error: {err}',
+                                           icon=MsgIcon.ERROR)
+                        self.logger.info('Monitoring nodes from previous job list')
+
+                self.check_nodes(skale, self.nodes, scheduled, start + MONITOR_PASS_TIMEOUT)
+                summary = check_samples.summary(since=started_at)
+                export_summary(summary)
+                self.logger.info(f'Checks of the pass: {format_summary(summary)}')
+                self.logger.info(f'SKALE Manager cache stats: {skale_cache.get_stats()}')
+
+                self.logger.info(f'{threading.enumerate()}')
+                self.logger.info('Monitor job finished.')
 
         except Exception as err:
             self.notifier.send(f'Error occurred during monitoring job: {err}', icon=MsgIcon.ERROR)
             self.logger.exception(err)
+        finally:
+            duration = time.monotonic() - start
+            self.count_pass_event('passes')
+            PASS_DURATION.observe(duration)
+            if duration > MONITOR_PASS_TIMEOUT:
+                self.count_pass_event('overrun')
+                self.logger.warning(f'Monitor pass took {duration:.1f}s, '
+                                    f'deadline is {MONITOR_PASS_TIMEOUT}s')
+            self.logger.info(f'Monitor pass stats: {self.pass_stats}')
+            self.monitor_lock.release()
+
+    def count_pass_event(self, event, count=1):
+        self.pass_stats[event] += count
+        PASS_EVENTS.inc(count, event=event)
+
+    def on_probe_result(self, node, metrics):
+        """Streams per-check results of a node probe to samples table and exporter."""
+        check_samples.add_metrics(node, metrics)
+        observe_checks(metrics.get('checks', []))
+
+    def on_job_not_run(self, event):
+        if event.job_id == MONITOR_JOB_ID:
+            self.count_pass_event('skipped')
+            self.logger.warning(f'Monitor pass scheduled at {event.scheduled_run_time} '
+                                f'was skipped')
 
     def report_job(self) -> bool:
         """
@@ -246,7 +354,8 @@ class SlaAgent:
             self.logger.info(f'{threading.enumerate()}')
             skale = spawn_skale_manager_lib(self.skale)
 
-            self.nodes = call_retry.call(skale.monitors.get_checked_array, self.id)
+            self.nodes = traced_retry(call_retry, 'monitors.get_checked_array',
+                                      skale.monitors.get_checked_array, self.id)
             nodes_for_report = self.get_reported_nodes(skale, self.nodes)
 
             if len(nodes_for_report) > 0:
@@ -263,16 +372,61 @@ class SlaAgent:
         else:
             return True
 
+    def retention_job(self) -> None:
+        """
+        Periodic job for removing outdated reports and rollups.
+        """
+        try:
+            self.logger.info('New retention job started...')
+            now = datetime.utcnow()
+            cutoff = now - timedelta(seconds=self.reward_period * REPORTS_RETENTION_EPOCHS)
+            if not DB_PARTITION_REPORTS or REPORTS_ARCHIVE_FOLDER:
+                deleted = retention.delete_old_reports(cutoff)
+                self.logger.info(f'{deleted} reports older than {cutoff} deleted')
+            if DB_PARTITION_REPORTS:
+                dropped = retention.maintain_report_partitions(cutoff)
+                self.logger.info(f'{dropped} report partitions older than {cutoff} dropped')
+
+            retention.delete_old_rollups(min(ROLLUP_PERIODS), cutoff)
+            rollups_cutoff = now - timedelta(
+                seconds=self.reward_period * ROLLUPS_RETENTION_EPOCHS)
+            retention.delete_old_rollups(max(ROLLUP_PERIODS), rollups_cutoff)
+            pruned = self.verdict_ledger.prune(
+                time.time() - self.reward_period * VERDICTS_RETENTION_EPOCHS)
+            self.logger.info(f'{pruned} sent verdicts pruned')
+            self.logger.info('Retention job finished.')
+        except Exception as err:
+            self.notifier.send(f'Error occurred during retention job: {err}', icon=MsgIcon.ERROR)
+            self.logger.exception(err)
+
     def run(self) -> None:
         """Starts sla agent."""
 
-        self.scheduler.add_job(self.monitor_job, 'interval', minutes=MONITOR_PERIOD)
+        self.scheduler.add_job(self.monitor_job, 'interval', kwargs={'scheduled': True},
+                               seconds=MONITOR_PERIOD * 60 // PROBE_SLOTS, id=MONITOR_JOB_ID,
+                               max_instances=1, coalesce=True)
+        self.scheduler.add_listener(self.on_job_not_run,
+                                    EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+        self.scheduler.add_job(db.recycle_db_connections, 'interval', minutes=DB_RECYCLE_PERIOD)
+        self.scheduler.add_job(self.retention_job, 'interval', hours=RETENTION_PERIOD)
 
         # TODO: enable when move to validator-based monitoring
         if not DISABLE_REPORTING:
             self.scheduler.add_job(self.report_job, 'interval', minutes=REPORT_PERIOD)
 
         self.scheduler.print_jobs()
+        try:
+            db.migrate_db()
+            if DB_PARTITION_REPORTS:
+                retention.partition_reports()
+        except Exception as err:
+            self.notifier.send(f'Failed to migrate database: {err}', icon=MsgIcon.ERROR)
+        if METRICS_ENABLED:
+            try:
+                start_http_server()
+            except OSError as err:
+                self.notifier.send(f'Failed to start metrics exporter: {err}',
+                                   icon=MsgIcon.WARNING)
         self.monitor_job()
         self.scheduler.start()
 
@@ -2,14 +2,15 @@
 
 import pytest
 
-from tests.constants import N_TEST_NODES
-from tests.prepare_validator import (create_dirs, create_set_of_nodes,
-                                     get_active_ids, init_skale_with_w3_wallet)
-
 
 @pytest.fixture(scope="session")
 def skale():
     """Returns a SKALE instance with provider from config"""
+    # Chain settings (ENDPOINT, ETH_PRIVATE_KEY) are only needed by tests using the chain
+    from tests.constants import N_TEST_NODES
+    from tests.prepare_validator import (create_dirs, create_set_of_nodes,
+                                         get_active_ids, init_skale_with_w3_wallet)
+
     skale = init_skale_with_w3_wallet()
 
     create_dirs()
@@ -0,0 +1,114 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+
+from tools import ping
+from tools.budget import ProbeBudget, RttHistory
+from tools.exceptions import PassDeadlineException
+from tools.planner import ProbePlanner
+
+HOST = '1.1.1.1'
+SHARES = {'ping': 0.2, 'watchdog': 0.3, 'schain': 0.5}
+MINIMUMS = {'ping': 2, 'watchdog': 1, 'schain': 1}
+
+
+def create_budget(total=10, history=None, **kwargs):
+    return ProbeBudget(total, history=history or RttHistory(min_samples=5), shares=SHARES,
+                       factor=3, minimums=MINIMUMS, **kwargs)
+
+
+def test_p95_needs_enough_samples():
+    history = RttHistory(size=100, min_samples=5)
+    for duration in range(4):
+        history.add('ping', HOST, duration)
+    assert history.p95('ping', HOST) is None
+    for duration in range(4, 100):
+        history.add('ping', HOST, duration)
+    assert history.p95('ping', HOST) == 94
+    assert history.p95('ping', '2.2.2.2') is None
+
+
+def test_history_of_dropped_targets_forgotten():
+    planner = ProbePlanner(period=600, slots=6)
+    nodes = [{'id': 1, 'ip': HOST}, {'id': 2, 'ip': '2.2.2.2'}]
+    planner.plan(nodes, now=0)
+    with mock.patch('tools.planner.rtt_history', RttHistory(min_samples=1)) as history:
+        history.add('ping', HOST, 0.1)
+        history.add('ping', '2.2.2.2', 0.1)
+        planner.plan(nodes[1:], now=0)
+    assert history.p95('ping', HOST) is None
+    assert history.p95('ping', '2.2.2.2') == 0.1
+
+
+def test_timeouts_split_budget_by_shares():
+    budget = create_budget()
+    assert budget.timeout('ping', HOST) == pytest.approx(2, abs=0.01)
+    # Unused time of earlier checks goes to the checks left
+    assert budget.timeout('watchdog', HOST) == pytest.approx(10 * 3 / 8, abs=0.01)
+    assert budget.timeout('schain', HOST) == pytest.approx(10, abs=0.01)
+
+
+def test_timeouts_follow_rtt_history():
+    history = RttHistory(min_samples=5)
+    for _ in range(5):
+        history.add('watchdog', HOST, 0.5)
+        history.add('schain', HOST, 0.1)
+    budget = create_budget(history=history)
+    assert budget.timeout('watchdog', HOST) == pytest.approx(1.5)
+    # Never less than the check minimum
+    assert budget.timeout('schain', HOST) == 1
+
+
+def test_timeouts_limited_by_remaining_budget():
+    budget = create_budget(total=10, deadline=time.monotonic() + 2.5)
+    assert budget.timeout('ping', HOST) <= 2.5
+    # Less than the check minimum left: the node is deferred, not probed with 0 timeout
+    budget.deadline = time.monotonic() - 1
+    assert budget.remaining() == 0
+    with pytest.raises(PassDeadlineException):
+        budget.timeout('schain', HOST)
+
+
+def test_ping_stops_at_timeout():
+    async def lost_echo(host, port=None, timeout=None):
+        await asyncio.sleep(timeout)
+
+    with mock.patch('tools.ping.icmp_allowed', return_value=False), \
+            mock.patch('tools.ping.tcp_probe', side_effect=lost_echo) as probe:
+        start = time.monotonic()
+        result = asyncio.run(ping.ping_host(HOST, count=3, timeout=0.3))
+    assert time.monotonic() - start < 1
+    assert result == {'is_offline': True, 'latency': -1}
+    assert probe.call_count == 1
+    assert probe.call_args[0][2] == pytest.approx(0.3, abs=0.05)
+
+
+def test_ping_stops_once_host_is_offline():
+    async def lost_echo(host, port=None, timeout=None):
+        return None
+
+    with mock.patch('tools.ping.icmp_allowed', return_value=False), \
+            mock.patch('tools.ping.tcp_probe', side_effect=lost_echo) as probe:
+        result = asyncio.run(ping.ping_host(HOST, count=4))
+    assert result == {'is_offline': True, 'latency': -1}
+    assert probe.call_count == 2
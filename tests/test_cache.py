@@ -0,0 +1,59 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from unittest import mock
+
+from tools.cache import SkaleCache
+
+METHOD = 'nodes.get'
+
+
+def test_cache_hits_and_misses():
+    cache = SkaleCache(ttls={METHOD: 60}, max_blocks={})
+    loader = mock.Mock(side_effect=lambda node_id: {'id': node_id})
+    assert cache.get(METHOD, loader, 1) == {'id': 1}
+    assert cache.get(METHOD, loader, 1) == {'id': 1}
+    assert cache.get(METHOD, loader, 2) == {'id': 2}
+    assert loader.call_count == 2
+    assert cache.get_stats() == {METHOD: {'hits': 1, 'misses': 2}}
+
+    cache.invalidate(METHOD)
+    cache.get(METHOD, loader, 1)
+    assert loader.call_count == 3
+
+
+def test_cache_ttl_and_blocks():
+    cache = SkaleCache(ttls={METHOD: 60}, max_blocks={METHOD: 10})
+    loader = mock.Mock(return_value=0)
+    cache.set_block_number(100)
+    cache.get(METHOD, loader, 1)
+    cache.set_block_number(110)
+    cache.get(METHOD, loader, 1)
+    assert loader.call_count == 1
+    cache.set_block_number(111)
+    cache.get(METHOD, loader, 1)
+    assert loader.call_count == 2
+
+    with mock.patch('tools.cache.time.monotonic', return_value=10 ** 9):
+        cache.get(METHOD, loader, 1)
+    assert loader.call_count == 3
+
+    cache.get('uncached', loader, 1)
+    cache.get('uncached', loader, 1)
+    assert loader.call_count == 5
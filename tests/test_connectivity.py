@@ -0,0 +1,76 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import socket
+import time
+from unittest import mock
+
+from tools import ping
+from tools.connectivity import ConnectivityOracle
+
+IP_GOOD = '127.0.0.1'
+IP_BAD = '192.0.2.0'
+
+
+def test_connectivity_is_cached():
+    oracle = ConnectivityOracle(IP_GOOD, ttl=60)
+    assert oracle.is_online()
+    oracle.host = IP_BAD
+    assert oracle.is_online()
+    assert not oracle.refresh()
+    assert not oracle.is_online()
+
+
+def test_was_offline_during():
+    oracle = ConnectivityOracle(IP_GOOD, ttl=60)
+    before = time.monotonic()
+    oracle.refresh()
+    start = time.monotonic()
+    assert not oracle.was_offline_during(start, time.monotonic())
+
+    oracle.host = IP_BAD
+    oracle.refresh()
+    end = time.monotonic()
+    assert oracle.was_offline_during(start, end)
+    assert not oracle.was_offline_during(before, start)
+
+
+def test_raw_icmp_socket_tried_before_tcp():
+    def create_socket(family, sock_type, proto):
+        if sock_type == socket.SOCK_DGRAM:
+            raise PermissionError('ping_group_range')
+        return mock.Mock()
+
+    with mock.patch.object(ping, '_icmp_socket_type', None), \
+            mock.patch('tools.ping.socket.socket', side_effect=create_socket):
+        assert ping.get_icmp_socket_type() == socket.SOCK_RAW
+        assert ping.icmp_allowed()
+    with mock.patch.object(ping, '_icmp_socket_type', None), \
+            mock.patch('tools.ping.socket.socket', side_effect=PermissionError):
+        assert not ping.icmp_allowed()
+
+
+def test_tcp_fallback_uses_connectivity_port():
+    async def answer(host, port, timeout):
+        return 0.01 if port == 53 else None
+
+    oracle = ConnectivityOracle(IP_GOOD, ttl=60, port=53)
+    with mock.patch('tools.ping.icmp_allowed', return_value=False), \
+            mock.patch('tools.ping.tcp_probe', side_effect=answer):
+        assert oracle.refresh()
@@ -17,12 +17,15 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import random
 from datetime import datetime, timedelta
+from unittest import mock
 
 from tools import db
 
 
 def setup_module(module):
+    db.migrate_db()
     db.clear_all_reports()
 
 
@@ -43,3 +46,98 @@ def test_clear_all_reports():
     print(data)
     assert data['latency'] == 0
     assert data['downtime'] == 0
+
+
+def test_report_buffer():
+    db.clear_all_reports()
+    buffer = db.ReportBuffer(max_size=3)
+    buffer.add(0, 1, True, 40)
+    buffer.add(0, 2, False, 60)
+    assert db.get_count_of_report_records() == 0
+    assert buffer.flush() == 2
+    assert db.get_count_of_report_records() == 2
+
+    for _ in range(3):
+        buffer.add(0, 1, False, 10)
+    assert len(buffer) == 0
+    assert db.get_count_of_report_records() == 5
+    db.clear_all_reports()
+
+
+def test_get_month_metrics_for_nodes():
+    db.clear_all_reports()
+    db.save_metrics_to_db(0, 1, True, 40)
+    db.save_metrics_to_db(0, 1, False, -1)
+    db.save_metrics_to_db(0, 2, False, 10)
+    now = datetime.utcnow()
+    data = db.get_month_metrics_for_nodes(0, [1, 2, 3], now - timedelta(minutes=1), now)
+    assert data[1] == {'downtime': 1, 'latency': 40}
+    assert data[2] == {'downtime': 0, 'latency': 10}
+    assert data[3] == {'downtime': 0, 'latency': 0}
+    db.clear_all_reports()
+
+
+def test_month_metrics_from_rollups():
+    db.clear_all_reports()
+    for latency in (10, -1, 30, 50):
+        db.save_metrics_to_db(0, 1, latency < 0, latency)
+    db.report_buffer.add(0, 1, True, 70)
+    db.report_buffer.flush()
+    now = datetime.utcnow()
+    start = now - timedelta(days=3, minutes=7)
+    assert db.get_month_metrics_for_nodes(0, [1], start, now) == \
+        db.get_month_metrics_for_nodes(0, [1], start, now, use_rollups=False)
+    assert db.get_month_metrics_for_node(0, 1, start, now) == {'downtime': 2, 'latency': 40}
+    db.clear_all_reports()
+
+
+def test_month_metrics_from_rollups_of_past_days():
+    db.clear_all_reports()
+    rand = random.Random(8)
+    base = db.floor_stamp(datetime.utcnow(), 24 * 3600) - timedelta(days=4)
+    buffer = db.ReportBuffer(max_size=10000)
+    for minute in range(0, 4 * 24 * 60, 7):
+        for target_id in (1, 2):
+            is_offline = rand.random() < 0.2
+            buffer.add(0, target_id, is_offline, -1 if is_offline else rand.randint(1, 500),
+                       stamp=base + timedelta(minutes=minute, seconds=rand.randint(0, 59)))
+    buffer.flush()
+
+    windows = [
+        # Whole days and hours with non-aligned edges
+        (base + timedelta(days=1, hours=2, minutes=17, seconds=31),
+         base + timedelta(days=3, hours=5, minutes=3)),
+        # Whole hours only
+        (base + timedelta(hours=5, seconds=1), base + timedelta(hours=9, minutes=44)),
+        # Shorter than an hour
+        (base + timedelta(minutes=30), base + timedelta(minutes=50)),
+        # Aligned to day buckets
+        (base + timedelta(days=1), base + timedelta(days=3))
+    ]
+    for start, end in windows:
+        assert db.get_month_metrics_for_nodes(0, [1, 2], start, end) == \
+            db.get_month_metrics_for_nodes(0, [1, 2], start, end, use_rollups=False)
+
+    # Whole buckets are read from rollups only
+    start, end = windows[0]
+    expected = db.get_month_metrics_for_nodes(0, [1, 2], start, end)
+    db.Report.delete().where((db.Report.stamp >= base + timedelta(days=2)) &
+                             (db.Report.stamp < base + timedelta(days=3))).execute()
+    assert db.get_month_metrics_for_nodes(0, [1, 2], start, end) == expected
+    assert db.get_month_metrics_for_nodes(0, [1, 2], start, end, use_rollups=False) != expected
+    db.clear_all_reports()
+
+
+def test_rollups_without_sqlite_upsert():
+    db.clear_all_reports()
+    with mock.patch('tools.db.supports_upsert', return_value=False):
+        for latency in (10, -1, 30):
+            db.save_metrics_to_db(0, 1, latency < 0, latency)
+        db.report_buffer.add(0, 2, False, 20)
+        db.report_buffer.flush()
+    now = datetime.utcnow()
+    start = now - timedelta(days=3, minutes=7)
+    assert db.get_month_metrics_for_nodes(0, [1, 2], start, now) == \
+        db.get_month_metrics_for_nodes(0, [1, 2], start, now, use_rollups=False)
+    assert db.get_month_metrics_for_node(0, 1, start, now) == {'downtime': 1, 'latency': 20}
+    db.clear_all_reports()
@@ -0,0 +1,67 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import requests
+
+from tools.exporter import (CONTENT_TYPE, Counter, Gauge, Histogram, Registry,
+                            start_http_server)
+
+
+def test_render_metrics():
+    registry = Registry()
+    calls = Counter('calls_total', 'Calls', ['method'], registry=registry)
+    depth = Gauge('queue_depth', 'Queue depth', registry=registry)
+    duration = Histogram('duration_seconds', 'Duration', ['check'], registry=registry,
+                         buckets=(0.1, 1))
+    calls.inc(method='nodes.get')
+    calls.inc(2, method='nodes.get')
+    depth.set_function(lambda: 5)
+    for value in (0.05, 0.1, 0.5, 3):
+        duration.observe(value, check='ping')
+
+    assert registry.render() == '\n'.join([
+        '# HELP calls_total Calls',
+        '# TYPE calls_total counter',
+        'calls_total{method="nodes.get"} 3.0',
+        '# HELP queue_depth Queue depth',
+        '# TYPE queue_depth gauge',
+        'queue_depth 5.0',
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{check="ping",le="0.1"} 2.0',
+        'duration_seconds_bucket{check="ping",le="1.0"} 3.0',
+        'duration_seconds_bucket{check="ping",le="+Inf"} 4.0',
+        'duration_seconds_sum{check="ping"} 3.65',
+        'duration_seconds_count{check="ping"} 4.0',
+    ]) + '\n'
+
+
+def test_metrics_server():
+    registry = Registry()
+    Counter('calls_total', 'Calls', registry=registry).inc()
+    server = start_http_server(port=0, host='127.0.0.1', registry=registry)
+    try:
+        url = f'http://127.0.0.1:{server.server_port}'
+        response = requests.get(f'{url}/metrics', timeout=5)
+        assert response.headers['Content-Type'] == CONTENT_TYPE
+        assert 'calls_total 1.0' in response.text
+        assert requests.get(f'{url}/other', timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
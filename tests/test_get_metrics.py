@@ -18,13 +18,24 @@
 #   along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from tools.metrics import get_ping_node_results
+import asyncio
+from unittest import mock
+
+from tools.connectivity import ConnectivityOracle
+from tools.exceptions import NoInternetConnectionException, PassDeadlineException
+from tools.aio import run_sync
+from tools.metrics import check_schains_async, get_metrics_for_nodes, get_ping_node_results
+from tools.planner import ProbePlanner
 
 ID = 0
 IP_GOOD = '127.0.0.1'
 IP_BAD = '192.0.2.0'
 
 
+async def always_online():
+    return True
+
+
 def test_get_node_metrics_pos():
     ip = IP_GOOD
     metrics_ok = get_ping_node_results(ip)
@@ -46,3 +57,128 @@ def test_get_node_metrics_neg():
 
     assert latency == -1
     assert downtime is True
+
+
+def test_get_metrics_for_nodes_pass_timeout():
+    async def probe(skale, node, is_test_mode, full_check, budget, gated=False):
+        await asyncio.sleep(node['delay'])
+        return {'is_offline': False, 'latency': 1}
+
+    nodes = [{'id': 0, 'delay': 0}, {'id': 1, 'delay': 10}, {'id': 2, 'delay': 0}]
+    with mock.patch('tools.metrics.get_metrics_for_node_async', probe), \
+            mock.patch('tools.metrics.connectivity.is_online_async', always_online):
+        results = get_metrics_for_nodes(None, nodes, True, concurrency=2, pass_timeout=0.5)
+    assert results[0] == {'is_offline': False, 'latency': 1}
+    assert results[1]['is_offline'] and results[1]['timeout']
+    assert results[2] == {'is_offline': False, 'latency': 1}
+
+    with mock.patch('tools.metrics.get_metrics_for_node_async', probe), \
+            mock.patch('tools.metrics.connectivity.is_online_async', always_online):
+        results = get_metrics_for_nodes(None, nodes[1:], True, concurrency=1, pass_timeout=0.5)
+    assert results[1]['timeout']
+    assert isinstance(results[2], PassDeadlineException)
+
+
+def test_failed_probe_checks_connectivity():
+    async def probe(skale, node, is_test_mode, full_check, budget, gated=False):
+        return {'is_offline': node['id'] == 1, 'latency': 1}
+
+    oracle = ConnectivityOracle(IP_GOOD, ttl=60)
+    assert oracle.refresh()
+    oracle.host = IP_BAD
+    nodes = [{'id': 0}, {'id': 1}]
+    with mock.patch('tools.metrics.get_metrics_for_node_async', probe), \
+            mock.patch('tools.metrics.connectivity', oracle):
+        results = get_metrics_for_nodes(None, nodes, True, concurrency=2)
+        # State is cached, no ping until it's older than ttl
+        assert results[0] == {'is_offline': False, 'latency': 1}
+        assert results[1] == {'is_offline': True, 'latency': 1}
+        oracle.ttl = 0
+        results = get_metrics_for_nodes(None, nodes, True, concurrency=1)
+    assert results[0] == {'is_offline': False, 'latency': 1}
+    assert isinstance(results[1], NoInternetConnectionException)
+
+
+def test_stable_target_with_dead_watchdog_recorded_offline():
+    async def ping_ok(host, count=3, timeout=None):
+        return {'is_offline': False, 'latency': 1000}
+
+    async def watchdog_dead(url, timeout=None):
+        return 500, None
+
+    async def no_schains(skale, node_id, node_ip, checks=None, timeout=None):
+        return {}
+
+    planner = ProbePlanner(period=600, slots=6)
+    node = {'id': 1, 'ip': '10.0.0.1'}
+    for period in range(5):
+        for probe in planner.plan([node], now=period * 600):
+            planner.update(probe, False)
+    probe = planner.plan([node], now=5 * 600)[0]
+    assert probe.record
+    ping_only_ids = () if probe.full_check else (node['id'],)
+    with mock.patch('tools.metrics.ping_host', ping_ok), \
+            mock.patch('tools.metrics.watchdog_client.get_json', watchdog_dead), \
+            mock.patch('tools.metrics.check_schains_for_node_async', no_schains), \
+            mock.patch('tools.metrics.connectivity.is_online_async', always_online):
+        results = get_metrics_for_nodes(None, [node], False, concurrency=1,
+                                        ping_only_ids=ping_only_ids)
+    assert results[1]['is_offline']
+
+
+def test_open_breaker_target_answering_ping_gets_full_check():
+    async def ping_ok(host, count=3, timeout=None):
+        return {'is_offline': False, 'latency': 1000}
+
+    async def watchdog_dead(url, timeout=None):
+        return 500, None
+
+    async def no_schains(skale, node_id, node_ip, checks=None, timeout=None):
+        return {}
+
+    planner = ProbePlanner(period=600, slots=6)
+    node = {'id': 1, 'ip': '10.0.0.1'}
+    breaker = planner.get_state(node['id']).breaker
+    breaker.threshold = 1
+    planner.update(planner.plan([node], now=0)[0], True, is_reachable=False)
+    assert breaker.is_open
+
+    probe = planner.plan([node], now=600)[0]
+    assert probe.record and probe.full_check and probe.gated
+    with mock.patch('tools.metrics.ping_host', ping_ok), \
+            mock.patch('tools.metrics.watchdog_client.get_json', watchdog_dead), \
+            mock.patch('tools.metrics.check_schains_for_node_async', no_schains), \
+            mock.patch('tools.metrics.connectivity.is_online_async', always_online):
+        results = get_metrics_for_nodes(None, [node], False, concurrency=1,
+                                        gated_ids=(node['id'],))
+    assert results[1]['is_offline']
+    assert [check.check for check in results[1]['checks']] == ['ping', 'watchdog']
+    planner.update(probe, results[1]['is_offline'], results[1]['latency'] != -1)
+    assert breaker.state == 'closed'
+
+
+def test_node_deferred_when_pass_deadline_leaves_no_time_for_checks():
+    with mock.patch('tools.metrics.ping_host') as ping_mock:
+        results = get_metrics_for_nodes(None, [{'id': 1, 'ip': IP_GOOD}], True, concurrency=1,
+                                        pass_timeout=1)
+    assert isinstance(results[1], PassDeadlineException)
+    ping_mock.assert_not_called()
+
+
+def test_cancelled_schain_checks_are_not_failed():
+    async def post_json(url, payload, timeout):
+        await asyncio.sleep(0 if url.endswith(':1') else 10)
+        raise ConnectionError(url)
+
+    async def check():
+        checks = []
+        results = await check_schains_async(schains, IP_GOOD, timeout=5, checks=checks)
+        # Let cancelled checks finish
+        await asyncio.sleep(0.1)
+        return results, checks
+
+    schains = [{'name': 'failed', 'http_rpc_port': 1}, {'name': 'slow', 'http_rpc_port': 2}]
+    with mock.patch('tools.metrics.schain_client.post_json', post_json):
+        results, checks = run_sync(check())
+    assert results == {'failed': 1, 'slow': None}
+    assert [(result.name, result.ok) for result in checks] == [('failed', False), ('slow', None)]
@@ -19,7 +19,7 @@
 
 from unittest import mock
 
-import requests
+import aiohttp
 
 from configs import WATCHDOG_PORT, WATCHDOG_URL
 from tools.metrics import get_containers_healthcheck
@@ -29,51 +29,46 @@ def get_test_url(base):
     return f'http://{base}:{WATCHDOG_PORT}/{WATCHDOG_URL}'
 
 
-# This method will be used by the mock to replace requests.get
-def mocked_requests_get(*args, **kwargs):
-    class MockResponse:
-        def __init__(self, json_data, status_code):
-            self.json_data = json_data
-            self.status_code = status_code
-
-        def json(self):
-            return self.json_data
+# This method will be used by the mock to replace watchdog_client.get_json
+async def mocked_get_json(*args, **kwargs):
+    def mock_response(json_data, status_code):
+        return status_code, json_data if status_code == 200 else None
 
     data_ok1 = [{'name': 'container_name', 'state': {'Running': True, 'Paused': False}}]
     data_bad1 = [{'name': 'container_name', 'state': {'Running': False, 'Paused': False}}]
     data_bad2 = [{'name': 'container_name', 'state': {'Running': False, 'Paused': True}}]
 
     if args[0] == get_test_url('url_ok1'):
-        return MockResponse({'error': None, 'data': data_ok1}, 200)
+        return mock_response({'error': None, 'data': data_ok1}, 200)
     elif args[0] == get_test_url('url_bad1'):
-        return MockResponse({'error': None, 'data': data_bad1}, 200)
+        return mock_response({'error': None, 'data': data_bad1}, 200)
     elif args[0] == get_test_url('url_bad2'):
-        return MockResponse({'error': 'any_error', 'data': data_ok1}, 200)
+        return mock_response({'error': 'any_error', 'data': data_ok1}, 200)
     elif args[0] == get_test_url('url_bad3'):
-        return MockResponse({'error': None, 'data': data_ok1}, 500)
+        return mock_response({'error': None, 'data': data_ok1}, 500)
     elif args[0] == get_test_url('url_bad4'):
-        return MockResponse({'error': None, 'data': data_bad2}, 200)
+        return mock_response({'error': None, 'data': data_bad2}, 200)
     elif args[0] == get_test_url('url_bad5'):
-        return MockResponse({'error': None}, 200)
+        return mock_response({'error': None}, 200)
 
-    return MockResponse(None, 404)
+    return mock_response(None, 404)
 
 
-def connection_error(*args, **kwargs):
-    raise requests.exceptions.ConnectionError
+async def connection_error(*args, **kwargs):
+    raise aiohttp.ClientConnectionError
 
 
-def unknown_error(*args, **kwargs):
+async def unknown_error(*args, **kwargs):
     raise Exception
 
 
-@mock.patch('tools.metrics.requests.get', side_effect=mocked_requests_get)
+@mock.patch('tools.metrics.watchdog_client.get_json', side_effect=mocked_get_json)
 def test_healthcheck_pos(mock_get):
     res = get_containers_healthcheck('url_ok1')
     assert res == 0
 
 
-@mock.patch('tools.metrics.requests.get', side_effect=mocked_requests_get)
+@mock.patch('tools.metrics.watchdog_client.get_json', side_effect=mocked_get_json)
 def test_healthcheck_neg(mock_get):
     res = get_containers_healthcheck('url_bad1')
     assert res == 1
@@ -89,13 +84,13 @@ def test_healthcheck_neg(mock_get):
     assert res == 1
 
 
-@mock.patch('tools.metrics.requests.get', side_effect=connection_error)
+@mock.patch('tools.metrics.watchdog_client.get_json', side_effect=connection_error)
 def test_healthcheck_connection_error(mock_get):
     res = get_containers_healthcheck('url_ok')
     assert res == 1
 
 
-@mock.patch('tools.metrics.requests.get', side_effect=unknown_error)
+@mock.patch('tools.metrics.watchdog_client.get_json', side_effect=unknown_error)
 def test_healthcheck_unknown_error(mock_get):
     res = get_containers_healthcheck('url_ok')
     assert res == 1
@@ -0,0 +1,73 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from unittest import mock
+
+from tools.helper import MsgIcon, Notifier
+
+
+def get_notifier(**kwargs):
+    notifier = Notifier('SlaAgent', 'node', 0, '1.1.1.1', **kwargs)
+    notifier.start = mock.Mock()
+    return notifier
+
+
+def sent_messages(post_mock):
+    return [call[1]['json']['message'][1] for call in post_mock.call_args_list]
+
+
+@mock.patch('tools.helper.requests.post')
+def test_notifier_coalesces_messages(post_mock):
+    notifier = get_notifier()
+    for node_id in range(3):
+        notifier.send(f'Failed to check node {node_id}')
+    notifier.send('Failed to check node 0')
+    notifier.send('Critical', icon=MsgIcon.CRITICAL)
+    assert post_mock.call_count == 0
+
+    assert notifier.flush() == 2
+    assert sent_messages(post_mock) == [
+        'Critical',
+        'Failed to check node 0 (x2)\nFailed to check node 1\nFailed to check node 2'
+    ]
+    assert post_mock.call_args[1]['timeout']
+
+
+@mock.patch('tools.helper.requests.post')
+def test_notifier_skips_repeated_messages(post_mock):
+    notifier = get_notifier(dedup_window=600)
+    notifier.send('Error')
+    notifier.flush()
+    notifier.send('Error')
+    notifier.send('Another error')
+    notifier.flush()
+    assert sent_messages(post_mock) == ['Error', 'Another error']
+
+
+@mock.patch('tools.helper.requests.post')
+def test_notifier_rate_limit_and_overflow(post_mock):
+    notifier = get_notifier(rate_limit=1, queue_size=2)
+    assert notifier.send('Error') == 0
+    assert notifier.send('Warning', icon=MsgIcon.WARNING) == 0
+    assert notifier.send('Dropped') == 1
+    assert notifier.dropped == 1
+
+    assert notifier.flush() == 1
+    assert notifier.flush() == 0
+    assert sent_messages(post_mock) == ['Error']
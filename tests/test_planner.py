@@ -0,0 +1,113 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from tools.planner import ProbePlanner
+
+PERIOD = 600
+SLOTS = 6
+NODES = [{'id': node_id, 'ip': '1.1.1.1'} for node_id in range(12)]
+
+
+def run_period(planner, period, failing=()):
+    """Runs every slot of the period, returns a list of probes per slot."""
+    slots = []
+    for slot in range(SLOTS):
+        probes = planner.plan(NODES, now=period * PERIOD + slot * PERIOD // SLOTS)
+        for probe in probes:
+            planner.update(probe, probe.node['id'] in failing)
+        slots.append(probes)
+    return slots
+
+
+def recorded(slots):
+    return [probe.node['id'] for probes in slots for probe in probes if probe.record]
+
+
+def test_one_sample_per_period_spread_across_slots():
+    planner = ProbePlanner(period=PERIOD, slots=SLOTS)
+    for period in range(4):
+        slots = run_period(planner, period)
+        assert [len(probes) for probes in slots] == [2] * SLOTS
+        assert sorted(recorded(slots)) == list(range(12))
+        # Recorded samples of stable targets are full checks too
+        assert all(probe.full_check for probes in slots for probe in probes)
+
+
+def test_unstable_targets_probed_every_slot():
+    planner = ProbePlanner(period=PERIOD, slots=SLOTS, stable_window=6)
+    run_period(planner, 0)
+    slots = run_period(planner, 1, failing=(0,))
+    slots = run_period(planner, 2)
+    probes_of_failed = [probe for probes in slots for probe in probes if probe.node['id'] == 0]
+    assert len(probes_of_failed) == SLOTS
+    # Only the recorded sample is a full check, probes in between are pings
+    assert [(probe.record, probe.full_check) for probe in probes_of_failed] == \
+        [(True, True)] + [(False, False)] * (SLOTS - 1)
+    assert sorted(recorded(slots)) == list(range(12))
+
+
+def test_missed_slots_and_unscheduled_runs():
+    planner = ProbePlanner(period=PERIOD, slots=SLOTS)
+    probes = planner.plan(NODES, now=3 * PERIOD // SLOTS)
+    assert len(probes) == 8
+    for probe in probes:
+        planner.update(probe, False)
+    probes = planner.plan(NODES, scheduled=False, now=4 * PERIOD // SLOTS)
+    assert sorted(probe.node['id'] for probe in probes) == [4, 5, 10, 11]
+
+
+def test_unreachable_target_pinged_only_until_it_answers():
+    planner = ProbePlanner(period=PERIOD, slots=SLOTS)
+    for state in (planner.get_state(node['id']) for node in NODES):
+        state.breaker.threshold = 3
+    run_period(planner, 0, failing=(0,))
+    assert planner.count_open_breakers() == 1
+
+    # Open breaker: one gated full check sample per period and no extra probes
+    slots = run_period(planner, 1, failing=(0,))
+    probes_of_failed = [probe for probes in slots for probe in probes if probe.node['id'] == 0]
+    assert len(probes_of_failed) == 1
+    assert probes_of_failed[0][1:] == (True, True, 1, True)
+    assert sorted(recorded(slots)) == list(range(12))
+
+    # The recorded sample is a full check, once the target answers it closes the breaker
+    slots = run_period(planner, 2)
+    probes_of_failed = [probe for probes in slots for probe in probes if probe.node['id'] == 0]
+    assert probes_of_failed[0].record and probes_of_failed[0].full_check
+    assert not any(probe.gated for probe in probes_of_failed[1:])
+    assert planner.get_state(0).breaker.state == 'closed'
+    assert planner.count_open_breakers() == 0
+
+
+def test_trial_failure_opens_breaker_again():
+    planner = ProbePlanner(period=PERIOD, slots=SLOTS)
+    breaker = planner.get_state(0).breaker
+    breaker.threshold = 1
+    probe = planner.plan(NODES, now=0)[0]
+    planner.update(probe, True)
+    assert breaker.state == 'open'
+    planner.update(probe._replace(full_check=False), False)
+    assert breaker.state == 'half-open'
+    # Target answers ping but its services are down: reachable, the breaker closes
+    planner.update(probe, True, is_reachable=True)
+    assert breaker.state == 'closed'
+    planner.update(probe, True)
+    planner.update(probe._replace(full_check=False), False)
+    planner.update(probe, True, is_reachable=False)
+    assert breaker.state == 'open'
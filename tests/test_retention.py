@@ -0,0 +1,53 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from tools import db
+from tools.retention import delete_old_reports
+
+
+def setup_module(module):
+    db.migrate_db()
+
+
+def teardown_module(module):
+    db.clear_all_reports()
+
+
+def test_delete_old_reports(tmpdir):
+    db.clear_all_reports()
+    now = db.sample_stamp()
+    rows = [{'my_id': 0, 'target_id': 1, 'is_offline': False, 'latency': 10,
+             'stamp': now - timedelta(hours=hours)} for hours in range(10)]
+    db.save_reports_to_db(rows)
+
+    deleted = delete_old_reports(now - timedelta(hours=4, minutes=30), batch_size=2,
+                                 archive_folder=str(tmpdir))
+    assert deleted == 5
+    assert db.get_count_of_report_records() == 5
+
+    archived = []
+    for name in os.listdir(str(tmpdir)):
+        with gzip.open(os.path.join(str(tmpdir), name), 'rt') as archive_file:
+            archived.extend(archive_file.readlines())
+    assert len(archived) == 5
+    assert delete_old_reports(datetime.utcnow() - timedelta(days=1)) == 0
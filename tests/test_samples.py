@@ -0,0 +1,79 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from tools.exporter import PASS_CHECKS, PASS_FAILED_CHECKS
+from tools.metrics import evaluate_checks
+from tools.samples import (CONTAINER, PING, SCHAIN, WATCHDOG, CheckResult,
+                           CheckSamples, export_summary, format_summary)
+
+HOST = '1.1.1.1'
+CHECKS = [
+    CheckResult(PING, HOST, True, 1200, 800),
+    CheckResult(CONTAINER, 'skale_admin', True, 0, None),
+    CheckResult(CONTAINER, 'skale_api', False, 0, None),
+    CheckResult(WATCHDOG, HOST, False, 5000, 200),
+    CheckResult(SCHAIN, 'chain-a', True, 3000, 1024),
+    CheckResult(SCHAIN, 'chain-b', None, 0, None)
+]
+
+
+def test_evaluate_checks():
+    assert evaluate_checks(CHECKS[:1]) == {'is_offline': False, 'latency': 800}
+    assert evaluate_checks(CHECKS) == {'is_offline': 1, 'latency': 800,
+                                       'schains': {'chain-a': 0, 'chain-b': None}}
+    ok_checks = [check for check in CHECKS if check.check != WATCHDOG]
+    assert evaluate_checks(ok_checks)['is_offline'] == 0
+
+
+def test_check_samples():
+    samples = CheckSamples(capacity=10)
+    samples.add(1, CHECKS, stamp=100)
+    samples.add(2, CHECKS, stamp=200)
+    assert len(samples) == 10
+
+    rows = samples.rows(node_id=2, check=SCHAIN)
+    assert rows == [
+        {'stamp': 200, 'node_id': 2, 'check': SCHAIN, 'name': 'chain-a', 'ok': True,
+         'duration': 3000, 'value': 1024},
+        {'stamp': 200, 'node_id': 2, 'check': SCHAIN, 'name': 'chain-b', 'ok': None,
+         'duration': 0, 'value': None}
+    ]
+    # The oldest samples were overwritten
+    assert [row['node_id'] for row in samples.rows()] == [1] * 4 + [2] * 6
+
+    summary = samples.summary()
+    assert summary[(WATCHDOG, HOST)] == {'count': 2, 'failed': 2, 'avg_duration': 5000,
+                                         'max_duration': 5000}
+    assert summary[(PING, HOST)]['count'] == 1
+    assert samples.summary(since=150)[(CONTAINER, 'skale_api')]['failed'] == 1
+
+
+def test_pass_summary_exported_and_logged():
+    samples = CheckSamples(capacity=10)
+    samples.add(1, [CheckResult(PING, HOST, True, 1000, 1000),
+                    CheckResult(WATCHDOG, HOST, False, 2000000, None),
+                    CheckResult(SCHAIN, 'schain-1', True, 30000, 5)])
+    summary = samples.summary()
+    export_summary(summary)
+    assert PASS_CHECKS.get(check=WATCHDOG) == 1
+    assert PASS_FAILED_CHECKS.get(check=WATCHDOG) == 1
+    assert PASS_FAILED_CHECKS.get(check=PING) == 0
+    assert format_summary(summary, slowest=2) == \
+        f'failed: watchdog {HOST} (1/1); ' \
+        f'slowest: watchdog {HOST} (2.000s), schain schain-1 (0.030s)'
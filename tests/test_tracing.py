@@ -0,0 +1,75 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+
+import pytest
+import tenacity
+
+from tools.aio import run_sync
+from tools.exporter import SKALE_CALLS
+from tools.tracing import traced, traced_retry, tracer
+
+
+@traced(attributes=lambda host: {'host': host})
+async def probe(host):
+    await asyncio.sleep(0.01)
+    return 1
+
+
+@traced()
+def probe_all(hosts):
+    return [run_sync(probe(host)) for host in hosts]
+
+
+def test_spans_belong_to_trace(caplog):
+    retrying = tenacity.Retrying(stop=tenacity.stop_after_attempt(3), reraise=True)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 2:
+            raise ValueError('Try again')
+        return 'ok'
+
+    calls_before = SKALE_CALLS.get(method='nodes.get', kind='call') or 0
+    with caplog.at_level(logging.WARNING):
+        with tracer.trace('monitor_pass', slow_threshold=0) as root:
+            probe_all(['1.1.1.1', '2.2.2.2'])
+            assert traced_retry(retrying, 'nodes.get', flaky) == 'ok'
+
+    spans = tracer.get_spans(root.trace_id)
+    assert [(span.name, span.depth) for span in spans] == [
+        ('monitor_pass', 0), ('probe_all', 1), ('probe', 2), ('probe', 2), ('nodes.get', 1)
+    ]
+    assert spans[2].attributes == {'host': '1.1.1.1', 'result': 1}
+    assert spans[-1].attempts == 2 and spans[-1].outcome == 'ok'
+    assert SKALE_CALLS.get(method='nodes.get', kind='call') - calls_before == 2
+    assert 'Slow trace monitor_pass' in caplog.text
+    assert 'probe(host=2.2.2.2, result=1)' in caplog.text
+
+
+def test_span_outcome_on_error():
+    with pytest.raises(KeyError):
+        with tracer.trace('monitor_pass') as root:
+            with tracer.span('save_reports_to_db'):
+                raise KeyError('id')
+    spans = tracer.get_spans(root.trace_id)
+    assert [span.outcome for span in spans] == ['KeyError', 'KeyError']
@@ -0,0 +1,89 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of SKALE-NMS
+#
+#   Copyright (C) 2020 SKALE Labs
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+
+from tools.verdicts import VerdictLedger
+
+REP_DATE = 1600000000
+
+
+def test_sent_verdicts_survive_restart(tmp_path):
+    filepath = str(tmp_path / 'verdicts.jsonl')
+    ledger = VerdictLedger(filepath)
+    ledger.add_pending([(1, REP_DATE, (1, 0, 1000)), (2, REP_DATE, (2, 5, 2000))])
+    assert not ledger.is_sent(1, REP_DATE)
+    ledger.mark_sent([(1, REP_DATE), (2, REP_DATE)])
+    assert ledger.is_sent(1, REP_DATE)
+    assert not ledger.is_sent(1, REP_DATE + 1)
+
+    ledger = VerdictLedger(filepath)
+    assert ledger.is_sent(2, REP_DATE)
+    assert len(ledger) == 2
+
+
+def test_interrupted_send_is_not_sent(tmp_path):
+    filepath = str(tmp_path / 'verdicts.jsonl')
+    ledger = VerdictLedger(filepath)
+    ledger.add_pending([(1, REP_DATE, (1, 0, 1000))])
+    ledger.mark_sent([(1, REP_DATE)])
+    ledger.add_pending([(2, REP_DATE, (2, 0, 1000))])
+    # Crash while writing the next record
+    with open(filepath, 'a') as ledger_file:
+        ledger_file.write('{"node_id": 3, "rep_da')
+
+    ledger = VerdictLedger(filepath)
+    assert ledger.is_sent(1, REP_DATE)
+    assert not ledger.is_sent(2, REP_DATE)
+    ledger.mark_sent([(2, REP_DATE)])
+    with open(filepath) as ledger_file:
+        records = [json.loads(line) for line in ledger_file]
+    assert [record['status'] for record in records] == ['pending', 'sent', 'pending', 'sent']
+    assert VerdictLedger(filepath).is_sent(2, REP_DATE)
+
+
+def test_prune_by_report_date(tmp_path):
+    filepath = str(tmp_path / 'verdicts.jsonl')
+    ledger = VerdictLedger(filepath)
+    for rep_date in (REP_DATE, REP_DATE + 100, REP_DATE + 200):
+        ledger.add_pending([(1, rep_date, (1, 0, 1000))])
+        ledger.mark_sent([(1, rep_date)])
+    assert ledger.prune(REP_DATE + 100) == 1
+    assert ledger.prune(REP_DATE + 100) == 0
+
+    ledger = VerdictLedger(filepath)
+    assert len(ledger) == 2
+    assert not ledger.is_sent(1, REP_DATE)
+    assert ledger.is_sent(1, REP_DATE + 200)
+
+
+def test_corrupted_records_skipped(tmp_path):
+    filepath = str(tmp_path / 'verdicts.jsonl')
+    ledger = VerdictLedger(filepath)
+    ledger.add_pending([(1, REP_DATE, (1, 0, 1000))])
+    with open(filepath, 'a') as ledger_file:
+        ledger_file.write('{"node_id": 2, "rep\x00\n[1, 2]\n')
+        # Records without status, with unhashable node id and with unknown status
+        ledger_file.write('{"node_id": 3, "rep_date": 1600000000, "verdict": [3, 0, 1]}\n')
+        ledger_file.write('{"node_id": [4], "rep_date": 1600000000, "status": "sent"}\n')
+        ledger_file.write('{"node_id": 5, "rep_date": 1600000000, "status": "lost"}\n')
+    ledger.mark_sent([(1, REP_DATE)])
+
+    ledger = VerdictLedger(filepath)
+    assert len(ledger) == 1
+    assert ledger.is_sent(1, REP_DATE)
@@ -0,0 +1,73 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Shared asyncio event loop for the agent.
+
+All async probes run on a single loop that lives in a daemon thread, so the
+synchronous APScheduler jobs can submit coroutines to it and wait for results.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop():
+    """Returns the shared event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_run_loop, args=(_loop,),
+                                      name='aio-loop', daemon=True)
+            thread.start()
+            logger.debug('Shared event loop started')
+        return _loop
+
+
+async def _run_in_context(coro, context):
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+def run_sync(coro, timeout=None):
+    """
+    Runs a coroutine on the shared loop and blocks until it's done. The coroutine sees
+    context variables of the caller (e.g. current tracing span).
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        _run_in_context(coro, contextvars.copy_context()), get_loop())
+    try:
+        return future.result(timeout)
+    except Exception:
+        future.cancel()
+        raise
@@ -0,0 +1,61 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Per-target circuit breaker.
+
+A target is unreachable when it doesn't answer ping: such a sample is offline whatever
+the other checks show, so they only waste time on it. After `threshold` unreachable
+probes in a row the breaker opens and the target is only pinged, once per sample.
+A full check of a reachable target closes the breaker. A ping answer alone moves it to
+half-open, then the next full check closes it if the target is reachable or opens it
+again otherwise.
+"""
+
+from configs import BREAKER_FAILURE_THRESHOLD
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_FAILURE_THRESHOLD):
+        self.threshold = threshold
+        self.state = CLOSED
+        self.failures = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def record(self, is_reachable, full_check=True) -> bool:
+        """Saves probe result, returns True if the breaker state changed."""
+        previous = self.state
+        if is_reachable:
+            self.failures = 0
+            if full_check:
+                self.state = CLOSED
+            elif self.state == OPEN:
+                self.state = HALF_OPEN
+        else:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+        return self.state != previous
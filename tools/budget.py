@@ -0,0 +1,112 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Latency budget of node probes.
+
+Every node probe gets PROBE_BUDGET seconds (less if the monitor pass deadline is
+closer), shared by check types in PROBE_BUDGET_SHARES proportions. Checks run one after
+another, so time not used by a check goes to the checks left. Timeout of a check is its
+share of the remaining budget, or p95 of recent durations of the check on the same host
+times PROBE_TIMEOUT_FACTOR if that is less, but never less than the check minimum. If
+the pass deadline leaves less than the minimum, the node is left for the next pass
+instead of being probed with a shorter timeout.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+
+from configs import (PROBE_BUDGET, PROBE_BUDGET_SHARES, PROBE_RTT_HISTORY,
+                     PROBE_RTT_MIN_SAMPLES, PROBE_TIMEOUT_FACTOR, PROBE_TIMEOUT_MIN)
+from tools.exceptions import PassDeadlineException
+
+
+class RttHistory:
+    """Durations of recent successful checks, per check type and host."""
+
+    def __init__(self, size=PROBE_RTT_HISTORY, min_samples=PROBE_RTT_MIN_SAMPLES):
+        self.size = size
+        self.min_samples = min_samples
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, check, host, duration):
+        with self._lock:
+            key = (check, host)
+            if key not in self._durations:
+                self._durations[key] = deque(maxlen=self.size)
+            self._durations[key].append(duration)
+
+    def p95(self, check, host):
+        """Returns p95 duration in seconds or None if there are not enough samples."""
+        with self._lock:
+            durations = sorted(self._durations.get((check, host), ()))
+        if len(durations) < self.min_samples:
+            return None
+        return durations[math.ceil(0.95 * len(durations)) - 1]
+
+    def forget(self, hosts):
+        """Drops history of the given hosts, e.g. targets that are not monitored anymore."""
+        with self._lock:
+            for key in [key for key in self._durations if key[1] in hosts]:
+                del self._durations[key]
+
+
+rtt_history = RttHistory()
+
+
+class ProbeBudget:
+    def __init__(self, total=PROBE_BUDGET, deadline=None, history=rtt_history,
+                 shares=PROBE_BUDGET_SHARES, factor=PROBE_TIMEOUT_FACTOR,
+                 minimums=PROBE_TIMEOUT_MIN):
+        self.deadline = time.monotonic() + total
+        if deadline is not None:
+            self.deadline = min(self.deadline, deadline)
+        self.history = history
+        self.shares = shares
+        self.factor = factor
+        self.minimums = minimums
+        self._left = set(shares)
+
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0)
+
+    def timeout(self, check, host) -> float:
+        """
+        Returns timeout for the check, the check is considered started.
+
+        Raises PassDeadlineException if less than the check minimum is left.
+        """
+        left_shares = sum(self.shares[name] for name in self._left | {check})
+        self._left.discard(check)
+        remaining = self.remaining()
+        minimum = self.minimums.get(check, 0)
+        if remaining < minimum:
+            raise PassDeadlineException(f'{remaining:.1f}s left for {check} check of {host}, '
+                                        f'{minimum}s needed')
+        timeout = remaining * self.shares[check] / left_shares
+        p95 = self.history.p95(check, host)
+        if p95 is not None:
+            timeout = min(timeout, p95 * self.factor)
+        return min(max(timeout, minimum), remaining)
+
+    def add_duration(self, check, host, duration):
+        self.history.add(check, host, duration)
@@ -0,0 +1,96 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+
+from configs import SKALE_CACHE_MAX_BLOCKS, SKALE_CACHE_TTLS
+from tools.exporter import SKALE_CALLS
+
+logger = logging.getLogger(__name__)
+
+
+class SkaleCache:
+    """
+    Read-through cache for SKALE Manager getters.
+
+    Every method has its own TTL in seconds (SKALE_CACHE_TTLS) and optionally a max
+    age in blocks (SKALE_CACHE_MAX_BLOCKS), checked against the block number set with
+    set_block_number. Methods without TTL are not cached.
+    """
+
+    def __init__(self, ttls=SKALE_CACHE_TTLS, max_blocks=SKALE_CACHE_MAX_BLOCKS):
+        self.ttls = ttls
+        self.max_blocks = max_blocks
+        self.block_number = None
+        self._entries = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _is_valid(self, method, entry):
+        value, expires_at, block_number = entry
+        if time.monotonic() >= expires_at:
+            return False
+        max_blocks = self.max_blocks.get(method)
+        return max_blocks is None or block_number is None or self.block_number is None or \
+            self.block_number - block_number <= max_blocks
+
+    def get(self, method, loader, *args):
+        """Returns cached result of loader(*args) or calls it and caches the result."""
+        ttl = self.ttls.get(method)
+        key = (method, args)
+        with self._lock:
+            stats = self._stats.setdefault(method, {'hits': 0, 'misses': 0})
+            entry = self._entries.get(key)
+            if ttl and entry is not None and self._is_valid(method, entry):
+                stats['hits'] += 1
+                SKALE_CALLS.inc(method=method, kind='cached')
+                return entry[0]
+            stats['misses'] += 1
+            block_number = self.block_number
+        SKALE_CALLS.inc(method=method, kind='call')
+
+        value = loader(*args)
+        if ttl:
+            with self._lock:
+                self._entries[key] = (value, time.monotonic() + ttl, block_number)
+        return value
+
+    def set_block_number(self, block_number):
+        """Updates current block number and drops entries that are too many blocks old."""
+        with self._lock:
+            self.block_number = block_number
+            expired = [key for key, entry in self._entries.items()
+                       if not self._is_valid(key[0], entry)]
+            for key in expired:
+                del self._entries[key]
+
+    def invalidate(self, method=None):
+        """Drops cached entries of the method or all of them."""
+        with self._lock:
+            for key in [key for key in self._entries if method in (None, key[0])]:
+                del self._entries[key]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {method: dict(stats) for method, stats in self._stats.items()}
+
+
+skale_cache = SkaleCache()
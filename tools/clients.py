@@ -0,0 +1,139 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Long-lived HTTP clients used by probes.
+
+Sessions belong to the shared event loop (tools.aio) and must only be used from it.
+"""
+
+import logging
+
+import aiohttp
+import requests
+
+from configs import (CLIENT_IDLE_TTL, SCHAIN_CLIENT_CONNECTIONS, SCHAIN_CLIENT_IDLE_TTL,
+                     SCHAIN_CLIENT_MAX_CONNECTIONS, WATCHDOG_CONDITIONAL_REQUESTS,
+                     WATCHDOG_CONNECT_TIMEOUT, WATCHDOG_CONNECTIONS_PER_HOST,
+                     WATCHDOG_MAX_CONNECTIONS, WATCHDOG_READ_TIMEOUT, WATCHDOG_TIMEOUT)
+
+logger = logging.getLogger(__name__)
+
+
+class SchainClient:
+    """
+    Shared keep-alive client for s-chain JSON-RPC requests.
+
+    One session serves every s-chain endpoint, its connector keeps up to `connections`
+    connections per endpoint and closes the ones idle for longer than `idle_ttl` seconds.
+    """
+
+    def __init__(self, max_connections=SCHAIN_CLIENT_MAX_CONNECTIONS,
+                 connections=SCHAIN_CLIENT_CONNECTIONS, idle_ttl=SCHAIN_CLIENT_IDLE_TTL):
+        self.max_connections = max_connections
+        self.connections = connections
+        self.idle_ttl = idle_ttl
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             limit_per_host=self.connections,
+                                             keepalive_timeout=self.idle_ttl)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def post_json(self, url, payload, timeout):
+        """Returns decoded JSON body of POST request with JSON payload to url."""
+        async with self._get_session().post(
+                url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            return await response.json(content_type=None)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class NotModified(Exception):
+    """Raised when server answered 304 and there is no cached response to reuse."""
+
+
+class WatchdogClient:
+    """
+    Shared keep-alive client for watchdog requests.
+
+    Connections are limited per host and connect/read timeouts are separate. Responses
+    are requested compressed, and if the server sends ETag, the next request is
+    conditional and a 304 answer reuses the previous response.
+    """
+
+    def __init__(self, conditional=WATCHDOG_CONDITIONAL_REQUESTS):
+        self.conditional = conditional
+        self._session = None
+        self._responses = {}
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=WATCHDOG_MAX_CONNECTIONS,
+                                             limit_per_host=WATCHDOG_CONNECTIONS_PER_HOST,
+                                             keepalive_timeout=CLIENT_IDLE_TTL)
+            timeout = aiohttp.ClientTimeout(total=WATCHDOG_TIMEOUT,
+                                            sock_connect=WATCHDOG_CONNECT_TIMEOUT,
+                                            sock_read=WATCHDOG_READ_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  headers={'Accept-Encoding': 'gzip, deflate'})
+        return self._session
+
+    async def get_json(self, url, timeout=None):
+        """
+        Returns (status code, decoded JSON body) of GET request to url.
+
+        timeout (seconds) limits the whole request instead of WATCHDOG_TIMEOUT.
+        """
+        headers = {}
+        cached = self._responses.get(url)
+        if self.conditional and cached is not None:
+            headers['If-None-Match'] = cached[0]
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout,
+                                                      sock_connect=WATCHDOG_CONNECT_TIMEOUT,
+                                                      sock_read=WATCHDOG_READ_TIMEOUT)
+        async with self._get_session().get(url, headers=headers, **kwargs) as response:
+            if response.status == 304:
+                if cached is None:
+                    raise NotModified(url)
+                return requests.codes.ok, cached[1]
+            if response.status != requests.codes.ok:
+                return response.status, None
+            res = await response.json(content_type=None)
+            etag = response.headers.get('ETag')
+        if self.conditional and etag:
+            self._responses[url] = (etag, res)
+        else:
+            self._responses.pop(url, None)
+        return response.status, res
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+schain_client = SchainClient()
+watchdog_client = WatchdogClient()
@@ -0,0 +1,111 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from configs import CONNECTIVITY_TCP_PORT, CONNECTIVITY_TTL, GOOD_IP
+from tools.aio import run_sync
+from tools.ping import ping_host
+
+logger = logging.getLogger(__name__)
+
+MAX_TRANSITIONS = 100
+
+
+class ConnectivityOracle:
+    """
+    Cached answer to "does this node have network access?".
+
+    The state is refreshed lazily by pinging GOOD_IP at most once per `ttl` seconds:
+    when a monitor pass starts and when a probe fails during the pass, so there is no
+    traffic to GOOD_IP between passes. Transitions are remembered so samples taken
+    while the network was down can be discarded.
+    """
+
+    def __init__(self, host=GOOD_IP, ttl=CONNECTIVITY_TTL, port=CONNECTIVITY_TCP_PORT):
+        self.host = host
+        self.ttl = ttl
+        self.port = port
+        self._lock = threading.Lock()
+        self._online = None
+        self._checked_at = 0
+        self._transitions = deque(maxlen=MAX_TRANSITIONS)
+        self._refreshing = None
+
+    def _save(self, online):
+        now = time.monotonic()
+        with self._lock:
+            if online != self._online:
+                if self._online is not None:
+                    logger.info(f'Connectivity changed: online = {online}')
+                self._transitions.append((now, online))
+                self._online = online
+            self._checked_at = now
+
+    def _get_fresh(self):
+        """Returns cached state or None if it's older than ttl."""
+        with self._lock:
+            if self._online is not None and time.monotonic() - self._checked_at < self.ttl:
+                return self._online
+        return None
+
+    async def refresh_async(self) -> bool:
+        """Pings GOOD_IP, concurrent callers on the loop share one ping."""
+        refreshing = self._refreshing
+        if refreshing is None:
+            refreshing = asyncio.ensure_future(ping_host(self.host, port=self.port))
+            refreshing.add_done_callback(self._on_refreshed)
+            self._refreshing = refreshing
+        return not (await asyncio.shield(refreshing))['is_offline']
+
+    def _on_refreshed(self, future):
+        self._refreshing = None
+        if not future.cancelled() and future.exception() is None:
+            self._save(not future.result()['is_offline'])
+
+    def refresh(self) -> bool:
+        return run_sync(self.refresh_async())
+
+    async def is_online_async(self) -> bool:
+        online = self._get_fresh()
+        return await self.refresh_async() if online is None else online
+
+    def is_online(self) -> bool:
+        online = self._get_fresh()
+        return self.refresh() if online is None else online
+
+    def was_offline_during(self, start, end) -> bool:
+        """Checks if connectivity was lost at any moment of [start, end] (monotonic time)."""
+        with self._lock:
+            transitions = list(self._transitions)
+        state = None
+        for stamp, online in transitions:
+            if stamp > end:
+                break
+            if stamp >= start and not online:
+                return True
+            state = online
+        return state is False
+
+
+connectivity = ConnectivityOracle()
@@ -18,22 +18,90 @@
 #   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import json
 import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
 
-from peewee import (BooleanField, DateTimeField, IntegerField, Model,
-                    MySQLDatabase, fn)
+import tenacity
+from peewee import (EXCLUDED, BigIntegerField, BooleanField, Case, DateTimeField,
+                    IntegerField, Model, MySQLDatabase, fn)
+from playhouse.pool import PooledMySQLDatabase, PooledSqliteDatabase
 
-from configs.db import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+from configs.db import (DB_BACKEND, DB_CONNECT_TIMEOUT, DB_HOST, DB_NAME,
+                        DB_PASSWORD, DB_POOL_SIZE, DB_POOL_WAIT_TIMEOUT, DB_PORT,
+                        DB_SQLITE_FILEPATH, DB_STALE_TIMEOUT, DB_USER,
+                        INSERT_CHUNK_SIZE, SQLITE_PRAGMAS,
+                        REPORT_BUFFER_MAX_AGE, REPORT_BUFFER_SIZE,
+                        REPORTS_SPILL_FILEPATH, ROLLUP_PERIODS)
+from tools.exporter import DB_WRITE_BATCH_SIZE, DB_WRITE_DURATION
+from tools.tracing import traced, traced_retry
 
 logger = logging.getLogger(__name__)
 
 
-dbhandle = MySQLDatabase(
-    DB_NAME, user=DB_USER,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
+def init_mysql_database():
+    return PooledMySQLDatabase(
+        DB_NAME, user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+        max_connections=DB_POOL_SIZE,
+        stale_timeout=DB_STALE_TIMEOUT,
+        timeout=DB_POOL_WAIT_TIMEOUT
+    )
+
+
+def init_sqlite_database():
+    return PooledSqliteDatabase(
+        DB_SQLITE_FILEPATH,
+        pragmas=SQLITE_PRAGMAS,
+        max_connections=DB_POOL_SIZE,
+        stale_timeout=DB_STALE_TIMEOUT,
+        timeout=DB_POOL_WAIT_TIMEOUT,
+        check_same_thread=False
+    )
+
+
+DB_BACKENDS = {
+    'mysql': init_mysql_database,
+    'sqlite': init_sqlite_database
+}
+
+# Connections are thread-local and taken from the pool, so concurrent writers do not
+# share a connection. The pool pings a connection before handing it out and
+# reconnects connections older than DB_STALE_TIMEOUT.
+dbhandle = DB_BACKENDS[DB_BACKEND]()
+
+
+def is_mysql():
+    return isinstance(dbhandle, MySQLDatabase)
+
+
+EPOCH_START = datetime(1970, 1, 1)
+ROLLUP_COUNTERS = ('offline_count', 'latency_sum', 'latency_count', 'sample_count')
+ROLLUP_KEY = ('my_id', 'target_id', 'period', 'bucket')
+# INSERT ... ON CONFLICT DO UPDATE is supported by SQLite since 3.24
+SQLITE_UPSERT_VERSION = (3, 24, 0)
+
+
+def sample_stamp():
+    # Report.stamp is stored with seconds precision, rollup buckets must agree with it
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def floor_stamp(stamp, period):
+    seconds = int((stamp - EPOCH_START).total_seconds())
+    return EPOCH_START + timedelta(seconds=seconds - seconds % period)
+
+
+def ceil_stamp(stamp, period):
+    floor = floor_stamp(stamp, period)
+    return floor if floor == stamp else floor + timedelta(seconds=period)
 
 
 class BaseModel(Model):
@@ -46,48 +114,352 @@ class Report(BaseModel):
     target_id = IntegerField()
     is_offline = BooleanField()
     latency = IntegerField()
-    stamp = DateTimeField()
+    stamp = DateTimeField(default=sample_stamp)
+
+    class Meta:
+        indexes = (
+            # Covers epoch aggregation queries
+            (('my_id', 'target_id', 'stamp', 'is_offline', 'latency'), False),
+        )
+
+
+class ReportRollup(BaseModel):
+    """Report totals for a `period` seconds long bucket starting at `bucket`."""
+    my_id = IntegerField()
+    target_id = IntegerField()
+    period = IntegerField()
+    bucket = DateTimeField()
+    offline_count = IntegerField(default=0)
+    latency_sum = BigIntegerField(default=0)
+    latency_count = IntegerField(default=0)
+    sample_count = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'report_rollup'
+        indexes = (
+            (('my_id', 'target_id', 'period', 'bucket'), True),
+        )
+
+
+def aggregate_rollups(rows) -> dict:
+    """Sums report rows into rollup buckets, returns a dict key -> counters."""
+    rollups = {}
+    for row in rows:
+        for period in ROLLUP_PERIODS:
+            key = (row['my_id'], row['target_id'], period, floor_stamp(row['stamp'], period))
+            counters = rollups.setdefault(key, dict.fromkeys(ROLLUP_COUNTERS, 0))
+            counters['offline_count'] += int(bool(row['is_offline']))
+            if row['latency'] >= 0:
+                counters['latency_sum'] += row['latency']
+                counters['latency_count'] += 1
+            counters['sample_count'] += 1
+    return rollups
+
+
+def update_rollups(rows):
+    """Adds report rows to rollup buckets, must be called in the same transaction."""
+    rollups = aggregate_rollups(rows)
+    data = [{'my_id': my_id, 'target_id': target_id, 'period': period, 'bucket': bucket,
+             **counters}
+            for (my_id, target_id, period, bucket), counters in rollups.items()]
+    for i in range(0, len(data), INSERT_CHUNK_SIZE):
+        if supports_upsert():
+            rollup_upsert_query(data[i:i + INSERT_CHUNK_SIZE]).execute()
+        else:
+            add_to_rollups(data[i:i + INSERT_CHUNK_SIZE])
+
+
+def supports_upsert():
+    return is_mysql() or sqlite3.sqlite_version_info >= SQLITE_UPSERT_VERSION
 
 
+def add_to_rollups(data):
+    """Upsert for old SQLite: creates missing buckets, then adds counters one by one."""
+    ReportRollup.insert_many([{name: row[name] for name in ROLLUP_KEY} for row in data]) \
+        .on_conflict_ignore().execute()
+    for row in data:
+        ReportRollup.update({getattr(ReportRollup, name): getattr(ReportRollup, name) + row[name]
+                             for name in ROLLUP_COUNTERS}) \
+            .where(*(getattr(ReportRollup, name) == row[name] for name in ROLLUP_KEY)) \
+            .execute()
+
+
+def rollup_upsert_query(data):
+    """Inserts rollup rows adding counters to already existing buckets."""
+    if is_mysql():
+        update = {getattr(ReportRollup, name): getattr(ReportRollup, name) +
+                  fn.VALUES(getattr(ReportRollup, name)) for name in ROLLUP_COUNTERS}
+        return ReportRollup.insert_many(data).on_conflict(update=update)
+
+    update = {getattr(ReportRollup, name): getattr(ReportRollup, name) +
+              getattr(EXCLUDED, name) for name in ROLLUP_COUNTERS}
+    conflict_target = [getattr(ReportRollup, name) for name in ROLLUP_KEY]
+    return ReportRollup.insert_many(data).on_conflict(conflict_target=conflict_target,
+                                                      update=update)
+
+
+@traced(attributes=lambda my_id, target_id, *args: {'target_id': target_id})
 @dbhandle.connection_context()
 def save_metrics_to_db(my_id, target_id, is_offline, latency):
     """Save metrics (downtime and latency) to database."""
     report = Report(my_id=my_id,
                     target_id=target_id,
                     is_offline=is_offline,
-                    latency=latency)
-    report.save()
+                    latency=latency,
+                    stamp=sample_stamp())
+    with dbhandle.atomic():
+        report.save()
+        update_rollups([report.__data__])
+
+
+db_retry = tenacity.Retrying(stop=tenacity.stop_after_attempt(3),
+                             wait=tenacity.wait_fixed(2),
+                             reraise=True)
+
+
+@traced(attributes=lambda rows: {'rows': len(rows)})
+@dbhandle.connection_context()
+def save_reports_to_db(rows):
+    """Save many report rows (dicts with Report fields) in one transaction."""
+    start = time.monotonic()
+    with dbhandle.atomic():
+        for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+            Report.insert_many(rows[i:i + INSERT_CHUNK_SIZE]).execute()
+        update_rollups(rows)
+    DB_WRITE_DURATION.observe(time.monotonic() - start)
+    DB_WRITE_BATCH_SIZE.observe(len(rows))
+
+
+class ReportBuffer:
+    """
+    Collects report rows and writes them to database in batches.
+
+    Rows are flushed explicitly (once per monitor pass) or when the buffer grows over
+    `max_size` rows or gets older than `max_age` seconds. If database stays unavailable
+    after retries, rows are spilled to a local file and written with the next flush.
+    """
+
+    def __init__(self, max_size=REPORT_BUFFER_SIZE, max_age=REPORT_BUFFER_MAX_AGE,
+                 spill_filepath=REPORTS_SPILL_FILEPATH):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.spill_filepath = spill_filepath
+        self._rows = []
+        self._first_added = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, my_id, target_id, is_offline, latency, stamp=None):
+        row = {'my_id': my_id, 'target_id': target_id, 'is_offline': bool(is_offline),
+               'latency': latency, 'stamp': (stamp or sample_stamp()).replace(microsecond=0)}
+        with self._lock:
+            if not self._rows:
+                self._first_added = time.monotonic()
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_size or \
+                time.monotonic() - self._first_added >= self.max_age
+        if full:
+            try:
+                self.flush()
+            except Exception:
+                # Rows are kept in the spill file until the next flush
+                pass
+
+    def flush(self) -> int:
+        """Writes buffered and spilled rows to database, returns number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            spilled = self._read_spilled()
+            if not rows and not spilled:
+                return 0
+            try:
+                traced_retry(db_retry, 'flush_reports', save_reports_to_db, spilled + rows,
+                             skale_call=False)
+            except Exception:
+                self._spill(rows)
+                logger.error(f'Failed to save {len(spilled) + len(rows)} reports, '
+                             f'kept in {self.spill_filepath}')
+                raise
+            if spilled:
+                os.remove(self.spill_filepath)
+                logger.info(f'{len(spilled)} spilled reports saved to database')
+            return len(spilled) + len(rows)
+
+    def _spill(self, rows):
+        with open(self.spill_filepath, 'a') as spill_file:
+            for row in rows:
+                spill_file.write(json.dumps({**row, 'stamp': row['stamp'].isoformat()}) + '\n')
+            spill_file.flush()
+            os.fsync(spill_file.fileno())
+
+    def _read_spilled(self) -> list:
+        try:
+            with open(self.spill_filepath) as spill_file:
+                lines = spill_file.readlines()
+        except FileNotFoundError:
+            return []
+        rows = []
+        for line in lines:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # Partially written line, e.g. after a crash
+                continue
+            row['stamp'] = datetime.fromisoformat(row['stamp'])
+            rows.append(row)
+        return rows
+
+
+report_buffer = ReportBuffer()
+
+
+def recycle_db_connections():
+    """
+    Closes idle pooled connections. Connections in use are left alone, long retention
+    and rollup rebuild transactions may hold them, the pool recycles them by
+    stale_timeout when they are returned.
+    """
+    dbhandle.close_idle()
+
+
+def latency_case():
+    # Negative latency marks a failed ping, such samples are left out of the average
+    return Case(None, [(Report.latency >= 0, Report.latency)], None)
+
+
+def raw_totals_query(my_id, target_ids, where):
+    return Report.select(
+        Report.target_id,
+        fn.SUM(Report.is_offline).alias('offline_count'),
+        fn.SUM(latency_case()).alias('latency_sum'),
+        fn.COUNT(latency_case()).alias('latency_count')
+    ).where(
+        (Report.my_id == my_id) &
+        Report.target_id.in_(target_ids) &
+        where
+    ).group_by(Report.target_id).dicts()
+
 
+def rollup_totals_query(my_id, target_ids, where):
+    return ReportRollup.select(
+        ReportRollup.target_id,
+        fn.SUM(ReportRollup.offline_count).alias('offline_count'),
+        fn.SUM(ReportRollup.latency_sum).alias('latency_sum'),
+        fn.SUM(ReportRollup.latency_count).alias('latency_count')
+    ).where(
+        (ReportRollup.my_id == my_id) &
+        ReportRollup.target_id.in_(target_ids) &
+        where
+    ).group_by(ReportRollup.target_id).dicts()
 
+
+def split_epoch(start_date, end_date):
+    """
+    Splits [start_date, end_date] into whole rollup buckets and raw edges.
+
+    Returns a list of (period, first bucket, end of last bucket) and a list of
+    (start, end, end is inclusive) ranges that have to be read from raw reports.
+    """
+    hour, day = min(ROLLUP_PERIODS), max(ROLLUP_PERIODS)
+    h0, h1 = ceil_stamp(start_date, hour), floor_stamp(end_date, hour)
+    if h0 >= h1:
+        return [], [(start_date, end_date, True)]
+    d0, d1 = ceil_stamp(h0, day), floor_stamp(h1, day)
+    if d0 < d1:
+        buckets = [(day, d0, d1), (hour, h0, d0), (hour, d1, h1)]
+    else:
+        buckets = [(hour, h0, h1)]
+    raw = [(start_date, h0, False), (h1, end_date, True)]
+    return [bucket for bucket in buckets if bucket[1] < bucket[2]], raw
+
+
+def get_epoch_totals(my_id, target_ids, start_date, end_date, use_rollups=True) -> dict:
+    """Returns a dict target id -> offline count, latency sum and latency count."""
+    if use_rollups:
+        buckets, raw = split_epoch(start_date, end_date)
+    else:
+        buckets, raw = [], [(start_date, end_date, True)]
+
+    raw_where = None
+    for start, end, inclusive in raw:
+        cond = (Report.stamp >= start) & \
+            ((Report.stamp <= end) if inclusive else (Report.stamp < end))
+        raw_where = cond if raw_where is None else raw_where | cond
+    queries = [raw_totals_query(my_id, target_ids, raw_where)]
+
+    if buckets:
+        rollup_where = None
+        for period, start, end in buckets:
+            cond = (ReportRollup.period == period) & \
+                (ReportRollup.bucket >= start) & (ReportRollup.bucket < end)
+            rollup_where = cond if rollup_where is None else rollup_where | cond
+        queries.append(rollup_totals_query(my_id, target_ids, rollup_where))
+
+    totals = {target_id: dict.fromkeys(ROLLUP_COUNTERS[:3], 0) for target_id in target_ids}
+    for query in queries:
+        for row in query:
+            for name in ROLLUP_COUNTERS[:3]:
+                totals[row['target_id']][name] += int(row[name] or 0)
+    return totals
+
+
+def to_epoch_metrics(totals) -> dict:
+    latency = totals['latency_sum'] / totals['latency_count'] \
+        if totals['latency_count'] else 0
+    return {'downtime': totals['offline_count'], 'latency': latency}
+
+
+@traced(attributes=lambda my_id, target_id, *args: {'target_id': target_id})
 @dbhandle.connection_context()
 def get_month_metrics_for_node(my_id, target_id, start_date, end_date) -> dict:
     """Returns a dict with aggregated month metrics - downtime and latency."""
+    totals = get_epoch_totals(my_id, [target_id], start_date, end_date)
+    return to_epoch_metrics(totals[target_id])
+
+
+@traced(attributes=lambda my_id, target_ids, *args, **kwargs: {'targets': len(target_ids)})
+@dbhandle.connection_context()
+def get_month_metrics_for_nodes(my_id, target_ids, start_date, end_date,
+                                use_rollups=True) -> dict:
+    """Returns a dict target id -> aggregated month metrics for all given targets."""
+    totals = get_epoch_totals(my_id, list(target_ids), start_date, end_date, use_rollups)
+    return {target_id: to_epoch_metrics(totals[target_id]) for target_id in target_ids}
+
+
+def rebuild_rollups():
+    """Recalculates all rollups from raw reports."""
+    ReportRollup.delete().execute()
+    query = Report.select(Report.my_id, Report.target_id, Report.is_offline,
+                          Report.latency, Report.stamp).dicts()
+    update_rollups(query.iterator())
+
+
+@dbhandle.connection_context()
+def migrate_db():
+    """Brings database schema up to date with models."""
+    if not Report.table_exists():
+        Report.create_table()
+    if not ReportRollup.table_exists():
+        logger.info('Creating report rollups, it may take a while...')
+        with dbhandle.atomic():
+            ReportRollup.create_table()
+            rebuild_rollups()
 
-    downtime_results = Report.select(
-        fn.SUM(
-            Report.is_offline).alias('sum')).where(
-        (Report.my_id == my_id) & (
-                Report.target_id == target_id) & (
-            Report.stamp >= start_date) & (
-            Report.stamp <= end_date))
-
-    latency_results = Report.select(
-        fn.AVG(
-            Report.latency).alias('avg')).where(
-        (Report.my_id == my_id) & (
-                Report.target_id == target_id) & (
-            Report.stamp >= start_date) & (
-            Report.stamp <= end_date) & (
-            Report.latency >= 0))
-    downtime = int(
-        downtime_results[0].sum) if downtime_results[0].sum is not None else 0
-    latency = latency_results[0].avg if latency_results[0].avg is not None else 0
-    return {'downtime': downtime, 'latency': latency}
+    existing = {index.name for index in dbhandle.get_indexes(Report._meta.table_name)}
+    for index in Report._meta.fields_to_index():
+        if index._name not in existing:
+            logger.info(f'Creating index {index._name}, it may take a while...')
+            dbhandle.execute(index)
 
 
 @dbhandle.connection_context()
 def clear_all_reports():
     nrows = Report.delete().execute()
+    ReportRollup.delete().execute()
     logger.info(f'{nrows} records deleted')
 
 
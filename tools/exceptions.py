@@ -24,3 +24,7 @@ class NodeNotFoundException(Exception):
 
 class NoInternetConnectionException(Exception):
     """Raised when no internet connection detected."""
+
+
+class PassDeadlineException(Exception):
+    """Raised when monitor pass deadline passed before the node was probed."""
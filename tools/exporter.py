@@ -0,0 +1,213 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Agent metrics in Prometheus text exposition format.
+
+Counters, gauges and histograms are plain in-memory values updated under a lock, the
+text is only rendered when /metrics is requested from the HTTP server thread.
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from configs import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    values = ','.join(f'{name}="{value}"' for name, value in labels)
+    return f'{{{values}}}'
+
+
+def format_value(value):
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return list(zip(self.labelnames, key))
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            return [f'{self.name}{format_labels(self._labels(key))} {format_value(value)}'
+                    for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """Value of the gauge without labels is taken from function on every render."""
+        self._function = function
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        if self._function is not None:
+            values[()] = self._function()
+        return [f'{self.name}{format_labels(self._labels(key))} {format_value(value)}'
+                for key, value in values.items()]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY,
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            counts, _ = self._values[key]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key][1] += value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_value(bound)
+                lines.append(f'{self.name}_bucket{format_labels(labels + [("le", le)])} '
+                             f'{format_value(cumulative)}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {format_value(cumulative)}')
+        return lines
+
+
+CHECK_DURATION = Histogram('sla_check_duration_seconds',
+                           'Duration of node checks by check type', ['check'])
+PASS_CHECKS = Gauge('sla_pass_checks', 'Checks made in the last monitor pass by check type',
+                    ['check'])
+PASS_FAILED_CHECKS = Gauge('sla_pass_failed_checks',
+                           'Failed checks in the last monitor pass by check type', ['check'])
+PING_RTT = Histogram('sla_ping_rtt_seconds', 'Average ping round trip time of online nodes')
+PASS_DURATION = Histogram('sla_monitor_pass_duration_seconds', 'Duration of monitor passes',
+                          buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+PASS_EVENTS = Counter('sla_monitor_pass_events_total',
+                      'Monitor passes, skipped and overrun passes, timed out and deferred probes',
+                      ['event'])
+OPEN_BREAKERS = Gauge('sla_open_circuit_breakers',
+                      'Targets pinged only as they have not answered ping for a long time')
+DB_WRITE_DURATION = Histogram('sla_db_write_duration_seconds', 'Duration of report batch writes')
+DB_WRITE_BATCH_SIZE = Histogram('sla_db_write_batch_size', 'Number of rows in report batch writes',
+                                buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+SKALE_CALLS = Counter('sla_skale_manager_calls_total',
+                      'SKALE Manager reads by method and how they were served', ['method', 'kind'])
+NOTIFIER_QUEUE_DEPTH = Gauge('sla_notifier_queue_depth', 'Notifications waiting to be sent')
+NOTIFIER_DROPPED = Counter('sla_notifier_dropped_total', 'Notifications dropped on overflow')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_http_server(port=METRICS_PORT, host=METRICS_HOST, registry=REGISTRY):
+    """Serves /metrics from a daemon thread, returns the server."""
+    handler = type('RegistryMetricsHandler', (MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True)
+    thread.start()
+    logger.info(f'Metrics are served on http://{host}:{server.server_port}/metrics')
+    return server
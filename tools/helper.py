@@ -20,7 +20,11 @@
 import json
 import logging
 import os
+import queue
 import re
+import threading
+import time
+from collections import OrderedDict, deque
 from enum import Enum
 
 import requests
@@ -28,14 +32,19 @@ import tenacity
 from skale import Skale
 from skale.wallets import RPCWallet
 
-from configs import CONFIG_CHECK_PERIOD, NOTIFIER_URL
+from configs import (CALL_RETRY_ATTEMPTS, CALL_RETRY_BUDGET, CALL_RETRY_WAIT,
+                     CONFIG_CHECK_PERIOD, NOTIFIER_DEDUP_WINDOW, NOTIFIER_FLUSH_INTERVAL,
+                     NOTIFIER_MAX_LINES, NOTIFIER_QUEUE_SIZE, NOTIFIER_RATE_LIMIT,
+                     NOTIFIER_TIMEOUT, NOTIFIER_URL)
 from configs.web3 import ABI_FILEPATH, ENDPOINT
 from tools.exceptions import NodeNotFoundException
+from tools.exporter import NOTIFIER_DROPPED
 
 logger = logging.getLogger(__name__)
 
-call_retry = tenacity.Retrying(stop=tenacity.stop_after_attempt(10),
-                               wait=tenacity.wait_fixed(2),
+call_retry = tenacity.Retrying(stop=(tenacity.stop_after_attempt(CALL_RETRY_ATTEMPTS) |
+                                     tenacity.stop_after_delay(CALL_RETRY_BUDGET)),
+                               wait=tenacity.wait_fixed(CALL_RETRY_WAIT),
                                reraise=True)
 _config_first_read = True
 
@@ -85,19 +94,139 @@ class MsgIcon(Enum):
     CRITICAL = '\ud83c\udd98'
 
 
+# Most severe first
+ICONS_ORDER = (MsgIcon.CRITICAL, MsgIcon.ERROR, MsgIcon.WARNING, MsgIcon.INFO)
+
+
 class Notifier:
-    def __init__(self, cont_name, node_name, node_id, node_ip):
+    """
+    Sends messages to telegram from a background thread.
+
+    send only puts the message to a bounded queue. Every `interval` seconds queued
+    messages are coalesced into one message per icon, repeated messages are counted
+    instead of sent again and messages already sent within `dedup_window` seconds are
+    skipped. At most `rate_limit` messages are posted per minute, the rest waits for the
+    next interval. When the queue is full, messages go to the log only.
+    """
+
+    def __init__(self, cont_name, node_name, node_id, node_ip,
+                 interval=NOTIFIER_FLUSH_INTERVAL, queue_size=NOTIFIER_QUEUE_SIZE,
+                 rate_limit=NOTIFIER_RATE_LIMIT, dedup_window=NOTIFIER_DEDUP_WINDOW):
         self.header = f'Container: {cont_name}, Node: {node_name}, ' \
                       f'ID: {node_id}, IP: {node_ip}\n'
+        self.interval = interval
+        self.rate_limit = rate_limit
+        self.dedup_window = dedup_window
+        self.dropped = 0
+        self.queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = OrderedDict()
+        self._sent = {}
+        self._post_times = deque()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
 
     def send(self, message, icon=MsgIcon.ERROR):
-        """Send message to telegram."""
+        """Queue message to telegram, returns 1 if it was dropped."""
         logger.info(message)
+        try:
+            self._queue.put_nowait((icon, message))
+        except queue.Full:
+            self.dropped += 1
+            NOTIFIER_DROPPED.inc()
+            logger.warning(f'Notification queue is full, message is not sent: {message}')
+            return 1
+        self.start()
+        return 0
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() + len(self._pending)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops background thread and tries to send what is left in the queue."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as err:
+                logger.exception(f'Failed to send notifications: {err}')
+
+    def _drain(self):
+        while True:
+            try:
+                icon, message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            key = (icon, message)
+            self._pending[key] = self._pending.get(key, 0) + 1
+        # Postponed messages are bounded as well, oldest ones are dropped
+        while len(self._pending) > self.queue_size:
+            (_, message), _ = self._pending.popitem(last=False)
+            self.dropped += 1
+            NOTIFIER_DROPPED.inc()
+            logger.warning(f'Too many postponed notifications, message is not sent: {message}')
+
+    def _is_duplicate(self, key, now):
+        sent_at = self._sent.get(key)
+        return sent_at is not None and now - sent_at < self.dedup_window
+
+    def _acquire(self, now):
+        while self._post_times and now - self._post_times[0] >= 60:
+            self._post_times.popleft()
+        if len(self._post_times) >= self.rate_limit:
+            return False
+        self._post_times.append(now)
+        return True
+
+    def flush(self) -> int:
+        """Sends queued messages, returns the number of messages posted."""
+        with self._flush_lock:
+            self._drain()
+            now = time.monotonic()
+            self._sent = {key: sent_at for key, sent_at in self._sent.items()
+                          if now - sent_at < self.dedup_window}
+            for key in [key for key in self._pending if self._is_duplicate(key, now)]:
+                logger.debug(f'Skipping repeated notification: {key[1]}')
+                del self._pending[key]
+
+            posted = 0
+            for icon in ICONS_ORDER:
+                keys = [key for key in self._pending if key[0] == icon][:NOTIFIER_MAX_LINES]
+                if not keys:
+                    continue
+                if not self._acquire(now):
+                    logger.info(f'Notification rate limit reached, '
+                                f'{len(self._pending)} messages are postponed')
+                    break
+                lines = [key[1] if self._pending[key] == 1 else
+                         f'{key[1]} (x{self._pending[key]})' for key in keys]
+                self._post(icon, '\n'.join(lines))
+                posted += 1
+                for key in keys:
+                    self._sent[key] = now
+                    del self._pending[key]
+            return posted
+
+    def _post(self, icon, message):
+        """Send message to telegram."""
         header = f'{icon.value} {self.header}'
         message_data = {"message": [header, message]}
 
         try:
-            response = requests.post(url=NOTIFIER_URL, json=message_data)
+            response = requests.post(url=NOTIFIER_URL, json=message_data,
+                                     timeout=NOTIFIER_TIMEOUT)
         except requests.exceptions.ConnectionError:
             logger.info(f'Cannot send Telegram notification (failed to connect to {NOTIFIER_URL})')
             return 1
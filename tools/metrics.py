@@ -17,102 +17,312 @@
 #   You should have received a copy of the GNU Affero General Public License
 #   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
 import logging
+import time
 
-import pingparsing
+import aiohttp
 import requests
 from skale.dataclasses.skaled_ports import SkaledPorts
 from skale.schain_config.ports_allocation import get_schain_base_port_on_node
-from web3 import HTTPProvider, Web3
 
-from configs import GOOD_IP, WATCHDOG_PORT, WATCHDOG_TIMEOUT, WATCHDOG_URL
-from tools.exceptions import NoInternetConnectionException
+from configs import (GOOD_IP, NODE_CHECK_TIMEOUT, SCHAIN_CHECK_TIMEOUT, WATCHDOG_PORT,
+                     WATCHDOG_URL)
+from tools.aio import run_sync
+from tools.budget import ProbeBudget
+from tools.cache import skale_cache
+from tools.clients import schain_client, watchdog_client
+from tools.connectivity import connectivity
+from tools.exceptions import NoInternetConnectionException, PassDeadlineException
+from tools.ping import ping_host
+from tools.samples import (CONTAINER, PING, SCHAIN, WATCHDOG, CheckResult,
+                           elapsed_us)
+from tools.tracing import traced
 
 logger = logging.getLogger(__name__)
 
 
-def check_internet_connection():
-    return not get_ping_node_results(GOOD_IP)['is_offline']
+def get_schain_endpoint(node_ip, rpc_port):
+    return 'http://' + node_ip + ':' + str(rpc_port)
 
 
-def get_metrics_for_node(skale, node, is_test_mode):
-    if not check_internet_connection():
-        raise NoInternetConnectionException
-    host = GOOD_IP if is_test_mode else node['ip']
+async def probe_node_async(skale, node, is_test_mode, full_check=True, budget=None,
+                           gated=False) -> list:
+    """
+    Runs node checks, returns a list of CheckResult, ping result goes first.
 
-    metrics = get_ping_node_results(host)
-    if not is_test_mode:
-        healthcheck = get_containers_healthcheck(host)
-        schains_check = check_schains_for_node(skale, node['id'], host)
-        # schains_check = 0  # TODO Remove!!!
-        metrics['is_offline'] = metrics['is_offline'] | healthcheck | schains_check
+    Gated full check runs watchdog and s-chains checks only if the node answers ping.
 
-    logger.info(f'Received metrics from node ID = {node["id"]}: {metrics}')
+    Checks share the latency budget, their timeouts are taken from it and durations of
+    successful checks are added to the budget history.
+    """
+    host = GOOD_IP if is_test_mode else node['ip']
+    budget = budget or ProbeBudget()
+    checks = []
+
+    start = time.monotonic()
+    ping = await get_ping_node_results_async(host, budget.timeout(PING, host))
+    checks.append(CheckResult(PING, host, not ping['is_offline'], elapsed_us(start),
+                              ping['latency']))
+    if not is_test_mode and full_check and not (gated and ping['is_offline']):
+        await get_containers_healthcheck_async(host, checks, budget.timeout(WATCHDOG, host))
+        await check_schains_for_node_async(skale, node['id'], host, checks,
+                                           budget.timeout(SCHAIN, host))
+    for result in checks:
+        if result.ok and result.check in budget.shares:
+            budget.add_duration(result.check, host, result.duration / 1e6)
+    return checks
+
+
+def evaluate_checks(checks) -> dict:
+    """Folds check results into node metrics (downtime and latency) used for reports."""
+    ping = checks[0]
+    metrics = {'is_offline': not ping.ok, 'latency': ping.value}
+    if len(checks) > 1:
+        metrics['schains'] = {result.name: None if result.ok is None else int(not result.ok)
+                              for result in checks if result.check == SCHAIN}
+        failed = any(result.ok is False for result in checks if result.check in
+                     (WATCHDOG, SCHAIN))
+        metrics['is_offline'] = metrics['is_offline'] | int(failed)
     return metrics
 
 
-def get_schain_endpoint(node_ip, rpc_port):
-    return 'http://' + node_ip + ':' + str(rpc_port)
+@traced('probe_node', lambda skale, node, *args: {'node_id': node['id']})
+async def get_metrics_for_node_async(skale, node, is_test_mode, full_check=True, budget=None,
+                                     gated=False):
+    checks = await probe_node_async(skale, node, is_test_mode, full_check, budget, gated)
+    metrics = evaluate_checks(checks)
+    logger.info(f'Received metrics from node ID = {node["id"]}: {metrics}')
+    metrics['checks'] = checks
+    return metrics
 
 
-def check_schain(schain, node_ip):
+def get_timeout_metrics():
+    return {'is_offline': True, 'latency': -1, 'timeout': True}
+
+
+async def get_metrics_for_nodes_async(skale, nodes, is_test_mode, concurrency,
+                                      timeout=NODE_CHECK_TIMEOUT, ping_only_ids=(),
+                                      pass_timeout=None, on_result=None,
+                                      gated_ids=()) -> dict:
+    """
+    Probes nodes concurrently, at most `concurrency` at once. Nodes from ping_only_ids
+    are pinged only, without watchdog and s-chains checks. Nodes from gated_ids get
+    watchdog and s-chains checks only if they answer ping.
+
+    Returns a dict node id -> metrics or an exception raised while probing the node.
+    Every node probe gets a latency budget ending no later than the pass deadline.
+    Nodes that do not respond within `timeout` seconds are reported offline. Samples
+    taken while this node itself had no connectivity are replaced with
+    NoInternetConnectionException.
+
+    After `pass_timeout` seconds probes still running are cut off and reported offline,
+    nodes that were not probed yet or whose checks could not get their minimum timeout
+    before the deadline get PassDeadlineException.
+
+    on_result(node, metrics) is called as soon as a node probe finishes.
+    """
+    if not nodes:
+        return {}
+    semaphore = asyncio.Semaphore(concurrency)
+    pass_start = time.monotonic()
+    pass_deadline = None if pass_timeout is None else pass_start + pass_timeout
+    started = set()
+
+    async def probe(node):
+        async with semaphore:
+            started.add(node['id'])
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    get_metrics_for_node_async(skale, node, is_test_mode,
+                                               node['id'] not in ping_only_ids,
+                                               ProbeBudget(deadline=pass_deadline),
+                                               node['id'] in gated_ids), timeout)
+            except asyncio.TimeoutError:
+                logger.info(f'Node {node["id"]} check timed out after {timeout}s')
+                result = get_timeout_metrics()
+            except PassDeadlineException as err:
+                logger.info(f'Node {node["id"]} check deferred: {err}')
+                return err
+            except asyncio.CancelledError:
+                # Not an Exception subclass only since Python 3.8
+                raise
+            except Exception as err:
+                result = err
+            if isinstance(result, Exception) or result['is_offline']:
+                # A failed probe could be caused by this node losing connectivity
+                await connectivity.is_online_async()
+            if connectivity.was_offline_during(start, time.monotonic()):
+                return NoInternetConnectionException()
+            if on_result is not None and not isinstance(result, Exception):
+                on_result(node, result)
+            return result
+
+    tasks = [asyncio.ensure_future(probe(node)) for node in nodes]
+    done, pending = await asyncio.wait(tasks, timeout=pass_timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if pending:
+        await connectivity.is_online_async()
+    offline_during_pass = connectivity.was_offline_during(pass_start, time.monotonic())
+
+    results = {}
+    for node, task in zip(nodes, tasks):
+        if task in done:
+            results[node['id']] = task.result()
+        elif node['id'] not in started:
+            results[node['id']] = PassDeadlineException(
+                f'Node {node["id"]} was not probed within {pass_timeout}s')
+        elif offline_during_pass:
+            results[node['id']] = NoInternetConnectionException()
+        else:
+            logger.info(f'Node {node["id"]} check cut off by pass deadline')
+            results[node['id']] = get_timeout_metrics()
+    return results
+
+
+def get_metrics_for_nodes(skale, nodes, is_test_mode, concurrency,
+                          timeout=NODE_CHECK_TIMEOUT, ping_only_ids=(), pass_timeout=None,
+                          on_result=None, gated_ids=()) -> dict:
+    """Sync wrapper around get_metrics_for_nodes_async for scheduler jobs."""
+    return run_sync(get_metrics_for_nodes_async(skale, nodes, is_test_mode, concurrency, timeout,
+                                                ping_only_ids, pass_timeout, on_result,
+                                                gated_ids))
+
+
+@traced('check_schain', lambda schain, node_ip, *args: {'schain': schain['name']})
+async def check_schain_async(schain, node_ip, checks=None, timeout=SCHAIN_CHECK_TIMEOUT):
     schain_name = schain['name']
     schain_endpoint = get_schain_endpoint(node_ip, schain['http_rpc_port'])
     logger.info(f'Checking s-chain {schain_name}: {schain_endpoint}')
 
+    payload = {'jsonrpc': '2.0', 'method': 'eth_blockNumber', 'params': [], 'id': 1}
+    start = time.monotonic()
+    block_number = None
     try:
-        web3 = Web3(HTTPProvider(schain_endpoint, request_kwargs={'timeout': 10}))
-        block_number = web3.eth.blockNumber
+        res = await schain_client.post_json(schain_endpoint, payload, timeout)
+        block_number = int(res['result'], 16)
         logger.info(f"Current block number for {schain_name} = {block_number}")
-        return 0
+        result = 0
+    except asyncio.CancelledError:
+        raise
     except Exception as err:
-        logger.error(f'Error occurred while getting block number: {err}')
-        return 1
+        logger.error(f'Error occurred while getting block number: {err!r}')
+        result = 1
+    if checks is not None:
+        checks.append(CheckResult(SCHAIN, schain_name, result == 0, elapsed_us(start),
+                                  block_number))
+    return result
 
 
-def check_schains_for_node(skale, node_id, node_ip):
-    raw_schains = skale.schains.get_active_schains_for_node(node_id)
+def get_schains_for_node(skale, node_id):
+    raw_schains = skale_cache.get('schains.get_active_schains_for_node',
+                                  skale.schains.get_active_schains_for_node, node_id)
 
-    node_info = skale.nodes.get(node_id)
+    node_info = skale_cache.get('nodes.get', skale.nodes.get, node_id)
     node_base_port = node_info['port']
 
-    schains = [{'name': schain['name'],
-                'index': schain['index'],
-                'http_rpc_port':
-                    get_schain_base_port_on_node(raw_schains, schain['name'],
-                                                 node_base_port) + SkaledPorts.HTTP_JSON.value}
-               for schain in raw_schains]
+    return [{'name': schain['name'],
+             'index': schain['index'],
+             'http_rpc_port':
+                 get_schain_base_port_on_node(raw_schains, schain['name'],
+                                              node_base_port) + SkaledPorts.HTTP_JSON.value}
+            for schain in raw_schains]
+
+
+async def check_schains_async(schains, node_ip, timeout=SCHAIN_CHECK_TIMEOUT,
+                              checks=None) -> dict:
+    """
+    Checks all s-chains at once, returns a dict s-chain name -> 0 (OK) or 1 (failed).
+
+    Checks share one deadline. Once any s-chain fails the rest are cancelled and
+    reported as None, s-chains that did not answer before the deadline are failed.
+    Results of every s-chain check are added to checks list if it's given.
+    """
+    loop = asyncio.get_event_loop()
+    tasks = {asyncio.ensure_future(check_schain_async(schain, node_ip, checks, timeout)):
+             schain['name'] for schain in schains}
+    results = dict.fromkeys(tasks.values())
+    pending = set(tasks)
+    deadline = loop.time() + timeout
+    failed = False
+    while pending and not failed:
+        done, pending = await asyncio.wait(pending, timeout=max(deadline - loop.time(), 0),
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            for task in pending:
+                logger.info(f'S-chain {tasks[task]} check timed out after {timeout}s')
+                results[tasks[task]] = 1
+                if checks is not None:
+                    checks.append(CheckResult(SCHAIN, tasks[task], False, int(timeout * 1e6),
+                                              None))
+            break
+        for task in done:
+            results[tasks[task]] = task.result()
+            failed = failed or task.result() == 1
+    for task in pending:
+        task.cancel()
+    if checks is not None:
+        checks.extend(CheckResult(SCHAIN, name, None, 0, None)
+                      for name, result in results.items() if result is None)
+    return results
+
+
+async def check_schains_for_node_async(skale, node_id, node_ip, checks=None,
+                                       timeout=SCHAIN_CHECK_TIMEOUT) -> dict:
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    schains = await loop.run_in_executor(None, get_schains_for_node, skale, node_id)
     logger.debug(f'schains = {schains}')
-    for schain in schains:
-        if check_schain(schain, node_ip) == 1:
-            return 1
-
-    return 0
+    # S-chains lookup is a part of the check time
+    timeout = max(timeout - (loop.time() - start), 0)
+    results = await check_schains_async(schains, node_ip, timeout, checks)
+    logger.info(f'S-chains check results for node ID = {node_id}: {results}')
+    return results
 
 
 def get_containers_healthcheck_url(host):
     return f'http://{host}:{WATCHDOG_PORT}/{WATCHDOG_URL}'
 
 
-def get_containers_healthcheck(host):
+@traced('get_containers_healthcheck', lambda host, *args: {'host': host})
+async def get_containers_healthcheck_async(host, checks=None, timeout=None):
     """Return 0 if OK or 1 if failed."""
     url = get_containers_healthcheck_url(host)
+    start = time.monotonic()
+    status = None
     try:
-        response = requests.get(url, timeout=WATCHDOG_TIMEOUT)
-    except requests.exceptions.ConnectionError as err:
+        status, res = await watchdog_client.get_json(url, timeout)
+    except aiohttp.ClientConnectionError as err:
         logger.info(f'Could not connect to {url}')
         logger.error(err)
-        return 1
+        result = 1
+    except asyncio.CancelledError:
+        raise
     except Exception as err:
         logger.info(f'Could not get data from {url}')
-        logger.error(err)
-        return 1
+        logger.error(repr(err))
+        result = 1
+    else:
+        if status != requests.codes.ok:
+            logger.info(f'Request to {url} failed, status code: {status}')
+            result = 1
+        else:
+            result = check_healthcheck_data(res, url, host, checks)
+    if checks is not None:
+        checks.append(CheckResult(WATCHDOG, host, result == 0, elapsed_us(start), status))
+    return result
 
-    if response.status_code != requests.codes.ok:
-        logger.info(f'Request to {url} failed, status code: {response.status_code}')
-        return 1
 
-    res = response.json()
+def get_containers_healthcheck(host):
+    """Return 0 if OK or 1 if failed."""
+    return run_sync(get_containers_healthcheck_async(host))
+
+
+def check_healthcheck_data(res, url, host, checks=None):
+    """Return 0 if all containers from watchdog response are OK or 1 otherwise."""
     if res.get('error') is not None:
         logger.info(res['error'])
         return 1
@@ -121,10 +331,14 @@ def get_containers_healthcheck(host):
         logger.info(f'No data found checking {url}')
         return 1
 
+    result = 0
     for container in data:
-        if not is_container_ok(container, host):
-            return 1
-    return 0
+        container_ok = is_container_ok(container, host)
+        if checks is not None:
+            checks.append(CheckResult(CONTAINER, container['name'], container_ok, 0, None))
+        if not container_ok:
+            result = 1
+    return result
 
 
 def is_container_ok(container, host):
@@ -142,23 +356,13 @@ def is_container_ok(container, host):
     return cont_status
 
 
+@traced(attributes=lambda host: {'host': host})
 def get_ping_node_results(host) -> dict:
     """Returns a node host metrics (downtime and latency)."""
-    ping_parser = pingparsing.PingParsing()
-    transmitter = pingparsing.PingTransmitter()
-    transmitter.destination_host = host
-    transmitter.ping_option = '-W1 -i 0.2'
-    transmitter.count = 3
-    result = transmitter.ping()
-    logger.debug(f'Ping {host} results: {result}')
-    if ping_parser.parse(
-            result).as_dict()['rtt_avg'] is None or ping_parser.parse(
-                result).as_dict()['packet_loss_count'] > 1:
-        is_offline = True
-        latency = -1
-        logger.info(f'No ping response from host {host}')
-    else:
-        is_offline = False
-        latency = int((ping_parser.parse(result).as_dict()['rtt_avg']) * 1000)
+    return run_sync(ping_host(host))
+
 
-    return {'is_offline': is_offline, 'latency': latency}
+@traced('get_ping_node_results', lambda host, *args: {'host': host})
+async def get_ping_node_results_async(host, timeout=None) -> dict:
+    """Returns a node host metrics (downtime and latency) without blocking the loop."""
+    return await ping_host(host, timeout=timeout)
@@ -0,0 +1,167 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+In-process latency prober.
+
+Uses unprivileged ICMP datagram sockets (see net.ipv4.ping_group_range), raw ICMP
+sockets if the process has CAP_NET_RAW, and falls back to measuring TCP connect time
+when neither is permitted.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import struct
+import time
+
+from configs import PING_COUNT, PING_INTERVAL, PING_TIMEOUT, TCP_PING_PORT
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+_icmp_socket_type = None
+_idents = itertools.count(os.getpid())
+
+
+def get_icmp_socket_type():
+    """Returns type of ICMP sockets this process may open or None if it may not."""
+    global _icmp_socket_type
+    if _icmp_socket_type is None:
+        errors = []
+        for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP).close()
+                _icmp_socket_type = sock_type
+                break
+            except OSError as err:
+                errors.append(err)
+        else:
+            logger.info(f'ICMP sockets are not available ({errors}), using TCP connect probes')
+            _icmp_socket_type = 0
+    return _icmp_socket_type or None
+
+
+def icmp_allowed():
+    """Returns True if this process may open datagram or raw ICMP sockets."""
+    return get_icmp_socket_type() is not None
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def make_echo_request(seq, ident=0):
+    payload = os.urandom(16)
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+async def icmp_probe(host, seq, timeout=PING_TIMEOUT):
+    """Returns echo round trip time in seconds or None if there was no reply."""
+    loop = asyncio.get_event_loop()
+    sock_type = get_icmp_socket_type()
+    is_raw = sock_type == socket.SOCK_RAW
+    ident = next(_idents) & 0xffff
+    sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+    sock.setblocking(False)
+    try:
+        sock.connect((host, 0))
+        start = time.perf_counter()
+        await loop.sock_sendall(sock, make_echo_request(seq, ident))
+        deadline = start + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            reply = await asyncio.wait_for(loop.sock_recv(sock, 1024), remaining)
+            # Kernel strips IP header and rewrites echo id for datagram sockets, raw
+            # sockets get IP header and every ICMP message from the host
+            offset = (reply[0] & 0x0f) * 4 if is_raw else 0
+            msg_type, _, _, reply_ident, reply_seq = struct.unpack(
+                '!BBHHH', reply[offset:offset + 8])
+            if msg_type == ICMP_ECHO_REPLY and reply_seq == seq and \
+                    (not is_raw or reply_ident == ident):
+                return time.perf_counter() - start
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        sock.close()
+
+
+async def tcp_probe(host, port=TCP_PING_PORT, timeout=PING_TIMEOUT):
+    """Returns TCP connect round trip time in seconds or None if host didn't answer."""
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except ConnectionRefusedError:
+        # RST from the host is an answer too
+        return time.perf_counter() - start
+    except (asyncio.TimeoutError, OSError):
+        return None
+    rtt = time.perf_counter() - start
+    writer.close()
+    return rtt
+
+
+async def ping_host(host, count=PING_COUNT, timeout=None, port=TCP_PING_PORT) -> dict:
+    """
+    Returns a node host metrics (downtime and latency).
+
+    If timeout (seconds) is given, echoes that can't be sent and answered within it are
+    not sent and count as lost. Port is used for TCP connect probes when ICMP is not
+    available.
+    """
+    use_icmp = icmp_allowed()
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    rtts = []
+    for seq in range(count):
+        if seq:
+            await asyncio.sleep(PING_INTERVAL)
+        probe_timeout = PING_TIMEOUT
+        if deadline is not None:
+            probe_timeout = min(probe_timeout, deadline - time.perf_counter())
+            if probe_timeout <= 0:
+                rtts.extend([None] * (count - seq))
+                break
+        rtts.append(await (icmp_probe(host, seq, probe_timeout) if use_icmp
+                           else tcp_probe(host, port, probe_timeout)))
+        if rtts.count(None) > 1:
+            # Host is offline already, the rest of echoes can't change it
+            rtts.extend([None] * (count - seq - 1))
+            break
+    replies = [rtt for rtt in rtts if rtt is not None]
+    logger.debug(f'Ping {host} results: {rtts}')
+
+    if not replies or count - len(replies) > 1:
+        logger.info(f'No ping response from host {host}')
+        return {'is_offline': True, 'latency': -1}
+    # Latency is kept in microseconds as it always was
+    latency = int(sum(replies) / len(replies) * 1000000)
+    return {'is_offline': False, 'latency': latency}
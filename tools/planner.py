@@ -0,0 +1,134 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Per-target probe planning.
+
+Monitor period is split into slots and targets are spread evenly across them. Every
+target gets exactly one recorded sample per period, taken in its own slot (or in the
+next run if its slot was missed), so every sample still stands for the same share of
+the period and downtime is computed the same way.
+
+Every recorded sample is a full check (ping, watchdog and s-chains), so a watchdog or
+s-chain outage is always recorded as downtime. What differs is how often targets are
+probed in between:
+- targets that failed or flapped recently are pinged in every slot in between, those
+  extra probes only track target state and are not recorded;
+- targets with an open circuit breaker (not answering ping for a long time) get no
+  extra probes, and their recorded samples are gated: the rest of the full check runs
+  only if the target answers ping, a sample without ping answer is offline anyway.
+"""
+
+import logging
+import time
+from collections import deque, namedtuple
+
+from configs import MONITOR_PERIOD, PROBE_SLOTS, PROBE_STABLE_WINDOW
+from tools.breaker import HALF_OPEN, CircuitBreaker
+from tools.budget import rtt_history
+
+logger = logging.getLogger(__name__)
+
+# Gated probe runs the full check only if the target answers ping
+Probe = namedtuple('Probe', ['node', 'full_check', 'record', 'period', 'gated'],
+                   defaults=(False,))
+
+
+class TargetState:
+    def __init__(self, window, host=None):
+        self.host = host
+        self.history = deque(maxlen=window)
+        self.last_sampled = None
+        self.breaker = CircuitBreaker()
+
+    def is_unstable(self) -> bool:
+        return any(self.history)
+
+
+class ProbePlanner:
+    def __init__(self, period=MONITOR_PERIOD * 60, slots=PROBE_SLOTS,
+                 stable_window=PROBE_STABLE_WINDOW):
+        self.period = period
+        self.slots = slots
+        self.stable_window = stable_window
+        self._targets = {}
+
+    @property
+    def slot_duration(self):
+        return self.period / self.slots
+
+    def get_position(self, now=None):
+        """Returns (period number, slot number) for the given unix time."""
+        now = time.time() if now is None else now
+        return int(now // self.period), int(now % self.period // self.slot_duration)
+
+    def get_state(self, node_id, host=None) -> TargetState:
+        if node_id not in self._targets:
+            self._targets[node_id] = TargetState(self.stable_window, host)
+        return self._targets[node_id]
+
+    def get_offsets(self, nodes) -> dict:
+        """Returns a dict node id -> slot, the same number of targets in every slot."""
+        node_ids = sorted(node['id'] for node in nodes)
+        return {node_id: i % self.slots for i, node_id in enumerate(node_ids)}
+
+    def plan(self, nodes, scheduled=True, now=None) -> list:
+        """
+        Returns a list of probes to run now.
+
+        Unscheduled runs (agent start) sample every target not sampled in this period yet.
+        """
+        period, slot = self.get_position(now)
+        offsets = self.get_offsets(nodes)
+        probes = []
+        for node in nodes:
+            state = self.get_state(node['id'], node.get('ip'))
+            sampled = state.last_sampled == period
+            due = not sampled and (not scheduled or offsets[node['id']] <= slot)
+            if due:
+                probes.append(Probe(node, True, True, period, state.breaker.is_open))
+            elif scheduled and state.is_unstable() and not state.breaker.is_open:
+                probes.append(Probe(node, state.breaker.state == HALF_OPEN, False, period))
+
+        current_ids = set(offsets)
+        dropped = [node_id for node_id in self._targets if node_id not in current_ids]
+        if dropped:
+            rtt_history.forget({self._targets[node_id].host for node_id in dropped})
+        for node_id in dropped:
+            del self._targets[node_id]
+        return probes
+
+    def count_open_breakers(self) -> int:
+        return sum(state.breaker.is_open for state in self._targets.values())
+
+    def update(self, probe, is_offline, is_reachable=None):
+        """
+        Saves probe result to target state.
+
+        is_reachable tells if the target answered ping, by default it's online targets.
+        """
+        state = self.get_state(probe.node['id'])
+        if state.history and bool(state.history[-1]) != bool(is_offline):
+            logger.info(f'Node {probe.node["id"]} is {"offline" if is_offline else "online"} now')
+        is_reachable = not is_offline if is_reachable is None else is_reachable
+        if state.breaker.record(is_reachable, probe.full_check):
+            logger.warning(f'Node {probe.node["id"]} circuit breaker is {state.breaker.state} now')
+        state.history.append(bool(is_offline))
+        if probe.record:
+            state.last_sampled = probe.period
@@ -0,0 +1,167 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Retention of raw reports and rollups.
+
+Old rows are removed in small batches so the table is never locked for long. When
+report table is partitioned by day (DB_PARTITION_REPORTS), whole partitions older
+than the cutoff are dropped instead, which also gives the disk space back.
+"""
+
+import calendar
+import csv
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from configs.db import (PARTITION_DAYS_AHEAD, REPORTS_ARCHIVE_FOLDER,
+                        RETENTION_BATCH_PAUSE, RETENTION_BATCH_SIZE)
+from tools.db import Report, ReportRollup, dbhandle, is_mysql
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FIELDS = ('id', 'my_id', 'target_id', 'is_offline', 'latency', 'stamp')
+MAX_PARTITION = 'pmax'
+
+
+def archive_reports(rows, archive_folder):
+    """Appends report rows to a gzipped CSV file per month of their stamp."""
+    files = {}
+    try:
+        for row in rows:
+            name = f'reports-{row["stamp"]:%Y-%m}.csv.gz'
+            if name not in files:
+                files[name] = gzip.open(os.path.join(archive_folder, name), 'at', newline='')
+            csv.writer(files[name]).writerow([row[field] for field in ARCHIVE_FIELDS])
+    finally:
+        for archive_file in files.values():
+            archive_file.close()
+
+
+@dbhandle.connection_context()
+def delete_old_reports(cutoff, batch_size=RETENTION_BATCH_SIZE,
+                       archive_folder=REPORTS_ARCHIVE_FOLDER) -> int:
+    """Deletes (and optionally archives) reports older than cutoff, returns rows deleted."""
+    deleted = 0
+    while True:
+        rows = list(Report.select().where(Report.stamp < cutoff)
+                    .order_by(Report.id).limit(batch_size).dicts())
+        if not rows:
+            break
+        if archive_folder:
+            archive_reports(rows, archive_folder)
+        ids = [row['id'] for row in rows]
+        deleted += Report.delete().where(Report.id.in_(ids)).execute()
+        if len(rows) < batch_size:
+            break
+        # Let the writers in between batches
+        time.sleep(RETENTION_BATCH_PAUSE)
+    return deleted
+
+
+@dbhandle.connection_context()
+def delete_old_rollups(period, cutoff) -> int:
+    """Deletes rollups of the given period that ended before cutoff."""
+    return ReportRollup.delete().where(
+        (ReportRollup.period == period) &
+        (ReportRollup.bucket < cutoff - timedelta(seconds=period))).execute()
+
+
+def partition_name(day):
+    return f'p{day:%Y%m%d}'
+
+
+def partition_bound(day):
+    # Report.stamp is UTC, MySQL session time zone is expected to be UTC too
+    return calendar.timegm((day + timedelta(days=1)).timetuple())
+
+
+def get_report_partitions() -> dict:
+    """Returns a dict partition name -> upper bound (unix time) for report table."""
+    cursor = dbhandle.execute_sql(
+        'SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL',
+        (Report._meta.table_name,))
+    return {name: int(bound) if bound.isdigit() else None for name, bound in cursor.fetchall()}
+
+
+def partition_definitions(days):
+    return ', '.join(f'PARTITION {partition_name(day)} VALUES LESS THAN '
+                     f'({partition_bound(day)})' for day in days)
+
+
+def future_days(first_day):
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    days = []
+    day = first_day
+    while day <= today + timedelta(days=PARTITION_DAYS_AHEAD):
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+@dbhandle.connection_context()
+def partition_reports():
+    """Converts report table to daily RANGE partitions on stamp. May take a while."""
+    if not is_mysql():
+        logger.warning('Partitioning is supported for MySQL backend only')
+        return
+    if get_report_partitions():
+        return
+    first = Report.select(Report.stamp).order_by(Report.stamp).limit(1).scalar() or \
+        datetime.utcnow()
+    days = future_days(first.replace(hour=0, minute=0, second=0, microsecond=0))
+    table = Report._meta.table_name
+    logger.info(f'Partitioning {table} table by day, {len(days)} partitions')
+    # Partitioning column has to be a part of every unique key
+    dbhandle.execute_sql(
+        f'ALTER TABLE `{table}` DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `stamp`) '
+        f'PARTITION BY RANGE (UNIX_TIMESTAMP(`stamp`)) ({partition_definitions(days)}, '
+        f'PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE)')
+
+
+@dbhandle.connection_context()
+def maintain_report_partitions(cutoff) -> int:
+    """Adds partitions for the next days and drops ones older than cutoff."""
+    if not is_mysql():
+        return 0
+    table = Report._meta.table_name
+    partitions = get_report_partitions()
+    if not partitions:
+        return 0
+    bounds = [bound for bound in partitions.values() if bound is not None]
+    last_day = datetime.utcfromtimestamp(max(bounds)) if bounds else \
+        datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    days = future_days(last_day)
+    if days:
+        dbhandle.execute_sql(
+            f'ALTER TABLE `{table}` REORGANIZE PARTITION {MAX_PARTITION} INTO '
+            f'({partition_definitions(days)}, '
+            f'PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE)')
+
+    cutoff_ts = calendar.timegm(cutoff.timetuple())
+    expired = [name for name, bound in partitions.items()
+               if bound is not None and bound <= cutoff_ts]
+    if expired:
+        logger.info(f'Dropping {table} partitions: {expired}')
+        dbhandle.execute_sql(f'ALTER TABLE `{table}` DROP PARTITION {", ".join(expired)}')
+    return len(expired)
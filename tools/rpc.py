@@ -0,0 +1,117 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Batched read-only calls to SKALE Manager contracts.
+
+Many eth_call requests are sent as one JSON-RPC batch. Entries that fail are retried
+on their own, and the ones that still fail go through a regular web3 call.
+"""
+
+import logging
+import socket
+import time
+
+import requests
+from hexbytes import HexBytes
+from skale.contracts.manager.nodes import NodeStatus
+from web3._utils.abi import get_abi_output_types
+
+from configs import RPC_BATCH_RETRIES, RPC_BATCH_SIZE, RPC_BATCH_WAIT, RPC_TIMEOUT
+from tools.exporter import SKALE_CALLS
+from tools.helper import call_retry
+
+logger = logging.getLogger(__name__)
+
+NODE_IP_FIELD = 1
+
+
+def get_function_abi(contract, fn_name):
+    return next(item for item in contract.abi
+                if item.get('type') == 'function' and item['name'] == fn_name)
+
+
+def get_endpoint(skale):
+    return getattr(skale.web3.provider, 'endpoint_uri', None)
+
+
+def send_batch(endpoint, requests_data) -> dict:
+    """Sends JSON-RPC batch, returns a dict request id -> result for successful entries."""
+    response = requests.post(endpoint, json=requests_data, timeout=RPC_TIMEOUT)
+    response.raise_for_status()
+    results = {}
+    for item in response.json():
+        if isinstance(item, dict) and item.get('error') is None and 'result' in item:
+            results[item['id']] = item['result']
+    return results
+
+
+def batch_call(skale, contract, fn_name, args_list) -> list:
+    """Calls contract function with every args from args_list, returns a list of results."""
+    fn_abi = get_function_abi(contract, fn_name)
+    output_types = get_abi_output_types(fn_abi)
+    endpoint = get_endpoint(skale)
+    results = {}
+
+    if endpoint and endpoint.startswith('http'):
+        calls = {i: {'jsonrpc': '2.0', 'id': i, 'method': 'eth_call',
+                     'params': [{'to': contract.address,
+                                 'data': contract.encodeABI(fn_name=fn_name, args=args)},
+                                'latest']}
+                 for i, args in enumerate(args_list)}
+        for attempt in range(RPC_BATCH_RETRIES):
+            pending = [i for i in calls if i not in results]
+            if not pending:
+                break
+            if attempt:
+                time.sleep(RPC_BATCH_WAIT)
+            for start in range(0, len(pending), RPC_BATCH_SIZE):
+                chunk = pending[start:start + RPC_BATCH_SIZE]
+                SKALE_CALLS.inc(len(chunk), method=fn_name, kind='batch')
+                try:
+                    results.update(send_batch(endpoint, [calls[i] for i in chunk]))
+                except Exception as err:
+                    logger.info(f'Batch {fn_name} call failed ({len(chunk)} calls): {err}')
+
+    decoded = []
+    for i, args in enumerate(args_list):
+        if i in results:
+            values = skale.web3.codec.decode_abi(output_types, HexBytes(results[i]))
+            decoded.append(values[0] if len(values) == 1 else list(values))
+        else:
+            SKALE_CALLS.inc(method=fn_name, kind='call')
+            decoded.append(call_retry(contract.functions[fn_name](*args).call))
+    return decoded
+
+
+def get_active_node_ids(skale) -> list:
+    """Same as skale.nodes.get_active_node_ids but with statuses fetched in batch."""
+    nodes_number = skale.nodes.get_nodes_number()
+    ids = list(range(nodes_number))
+    statuses = batch_call(skale, skale.nodes.contract, 'getNodeStatus',
+                          [[node_id] for node_id in ids])
+    return [node_id for node_id, status in zip(ids, statuses) if status == NodeStatus.ACTIVE]
+
+
+def get_node_ips(skale, node_ids) -> dict:
+    """Returns a dict node id -> IP address of the node for the given ids."""
+    raw_nodes = batch_call(skale, skale.nodes.contract, 'nodes',
+                           [[node_id] for node_id in node_ids])
+    return {node_id: socket.inet_ntoa(raw_node[NODE_IP_FIELD])
+            for node_id, raw_node in zip(node_ids, raw_nodes)}
@@ -0,0 +1,168 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Per-check probe results.
+
+Every node probe produces a list of CheckResult: ping, watchdog request, every
+container from watchdog response and every s-chain. They are kept in CheckSamples,
+a fixed size ring buffer stored column by column in typed arrays, so that slow or
+failing checks can be found without going through the logs: a summary of every monitor
+pass is logged and its check counts are exported. SLA verdicts do not use these
+samples, they are still computed from reports.
+"""
+
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from configs import CHECK_SAMPLES_CAPACITY, CHECK_SUMMARY_SLOWEST
+from tools.exporter import CHECK_DURATION, PASS_CHECKS, PASS_FAILED_CHECKS, PING_RTT
+
+PING = 'ping'
+WATCHDOG = 'watchdog'
+CONTAINER = 'container'
+SCHAIN = 'schain'
+CHECKS = (PING, WATCHDOG, CONTAINER, SCHAIN)
+
+# duration is in microseconds, value is ping latency, watchdog status code
+# or s-chain block number
+CheckResult = namedtuple('CheckResult', ['check', 'name', 'ok', 'duration', 'value'])
+
+NO_VALUE = -1
+OK_CODES = {True: 1, False: 0, None: -1}
+OK_VALUES = {code: ok for ok, code in OK_CODES.items()}
+
+
+def elapsed_us(start) -> int:
+    return int((time.monotonic() - start) * 1e6)
+
+
+def observe_checks(checks):
+    """Adds check durations to exporter histograms."""
+    for result in checks:
+        if result.check == CONTAINER or result.ok is None:
+            continue
+        CHECK_DURATION.observe(result.duration / 1e6, check=result.check)
+        if result.check == PING and result.ok:
+            PING_RTT.observe(result.value / 1e6)
+
+
+def export_summary(summary):
+    """Sets check and failure counts of the summary by check type to exporter gauges."""
+    for check in CHECKS:
+        totals = [total for (total_check, _), total in summary.items() if total_check == check]
+        PASS_CHECKS.set(sum(total['count'] for total in totals), check=check)
+        PASS_FAILED_CHECKS.set(sum(total['failed'] for total in totals), check=check)
+
+
+def format_summary(summary, slowest=CHECK_SUMMARY_SLOWEST) -> str:
+    """Returns failed and the slowest checks of the summary as a log line."""
+    failed = [f'{check} {name} ({total["failed"]}/{total["count"]})'
+              for (check, name), total in sorted(summary.items()) if total['failed']]
+    slow = sorted(summary.items(), key=lambda item: item[1]['max_duration'], reverse=True)
+    slow = [f'{check} {name} ({total["max_duration"] / 1e6:.3f}s)'
+            for (check, name), total in slow[:slowest] if total['max_duration']]
+    return f'failed: {", ".join(failed) or "none"}; slowest: {", ".join(slow) or "none"}'
+
+
+class CheckSamples:
+    def __init__(self, capacity=CHECK_SAMPLES_CAPACITY):
+        self.capacity = capacity
+        self.stamp = array('d', [0]) * capacity
+        self.node_id = array('l', [0]) * capacity
+        self.check = array('b', [0]) * capacity
+        self.name = array('l', [0]) * capacity
+        self.ok = array('b', [0]) * capacity
+        self.duration = array('q', [0]) * capacity
+        self.value = array('q', [0]) * capacity
+        self._names = []
+        self._name_ids = {}
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _name_id(self, name):
+        if name not in self._name_ids:
+            self._name_ids[name] = len(self._names)
+            self._names.append(name)
+        return self._name_ids[name]
+
+    def add(self, node_id, checks, stamp=None):
+        stamp = time.time() if stamp is None else stamp
+        with self._lock:
+            for result in checks:
+                i = self._next
+                self.stamp[i] = stamp
+                self.node_id[i] = node_id
+                self.check[i] = CHECKS.index(result.check)
+                self.name[i] = self._name_id(result.name)
+                self.ok[i] = OK_CODES[result.ok]
+                self.duration[i] = result.duration
+                self.value[i] = NO_VALUE if result.value is None else result.value
+                self._next = (i + 1) % self.capacity
+                self._size = min(self._size + 1, self.capacity)
+
+    def add_metrics(self, node, metrics):
+        """Sink for node probe results, see get_metrics_for_nodes_async."""
+        self.add(node['id'], metrics.get('checks', []))
+
+    def _indexes(self):
+        start = (self._next - self._size) % self.capacity
+        return [(start + i) % self.capacity for i in range(self._size)]
+
+    def rows(self, node_id=None, check=None, since=None) -> list:
+        """Returns samples as a list of dicts, oldest first."""
+        with self._lock:
+            return [{'stamp': self.stamp[i], 'node_id': self.node_id[i],
+                     'check': CHECKS[self.check[i]], 'name': self._names[self.name[i]],
+                     'ok': OK_VALUES[self.ok[i]], 'duration': self.duration[i],
+                     'value': None if self.value[i] == NO_VALUE else self.value[i]}
+                    for i in self._indexes()
+                    if (node_id is None or self.node_id[i] == node_id) and
+                    (check is None or CHECKS[self.check[i]] == check) and
+                    (since is None or self.stamp[i] >= since)]
+
+    def summary(self, since=None) -> dict:
+        """
+        Returns a dict (check, name) -> count, number of failures, average
+        and max duration of the samples taken since the given unix time.
+        """
+        totals = {}
+        with self._lock:
+            for i in self._indexes():
+                if since is not None and self.stamp[i] < since:
+                    continue
+                key = (CHECKS[self.check[i]], self._names[self.name[i]])
+                total = totals.setdefault(key, {'count': 0, 'failed': 0,
+                                                'avg_duration': 0, 'max_duration': 0})
+                total['count'] += 1
+                total['failed'] += self.ok[i] == 0
+                total['avg_duration'] += self.duration[i]
+                total['max_duration'] = max(total['max_duration'], self.duration[i])
+        for total in totals.values():
+            total['avg_duration'] //= total['count']
+        return totals
+
+
+check_samples = CheckSamples()
@@ -0,0 +1,166 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Lightweight tracing of probes and DB calls.
+
+Spans record wall time, number of attempts and outcome of a call and are kept in a
+ring buffer. Spans started within a trace (a monitor pass) belong to it, also across
+threads and coroutines of the shared loop: the current span is a context variable and
+run_sync passes the caller's context to the loop. When a trace takes longer than its
+threshold, all its spans are dumped to the log.
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from configs import TRACE_BUFFER_SIZE, TRACE_SLOW_THRESHOLD
+from tools.exporter import SKALE_CALLS
+
+logger = logging.getLogger(__name__)
+
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, span_id, name, parent, attributes):
+        self.id = span_id
+        self.name = name
+        self.trace_id = span_id if parent is None else parent.trace_id
+        self.parent_id = None if parent is None else parent.id
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.attributes = attributes
+        self.attempts = 0
+        self.outcome = None
+        self.start = time.time()
+        self.duration = None
+
+    def __repr__(self):
+        attributes = ', '.join(f'{key}={value}' for key, value in self.attributes.items())
+        attempts = f' attempts={self.attempts}' if self.attempts > 1 else ''
+        return f'{self.name}({attributes}) {self.duration:.3f}s {self.outcome}{attempts}'
+
+
+class Tracer:
+    def __init__(self, size=TRACE_BUFFER_SIZE, slow_threshold=TRACE_SLOW_THRESHOLD):
+        self.slow_threshold = slow_threshold
+        self._spans = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Records the wrapped block as a span, a child of the current one if any."""
+        span = Span(next(self._ids), name, current_span.get(), attributes)
+        token = current_span.set(span)
+        start = time.monotonic()
+        try:
+            yield span
+            span.outcome = 'ok'
+        except BaseException as err:
+            span.outcome = type(err).__name__
+            raise
+        finally:
+            span.duration = time.monotonic() - start
+            current_span.reset(token)
+            with self._lock:
+                self._spans.append(span)
+
+    @contextmanager
+    def trace(self, name, slow_threshold=None, **attributes):
+        """Starts a new trace, its spans are dumped if it takes longer than threshold."""
+        threshold = self.slow_threshold if slow_threshold is None else slow_threshold
+        token = current_span.set(None)
+        try:
+            with self.span(name, **attributes) as root:
+                yield root
+        finally:
+            current_span.reset(token)
+            if root.duration > threshold:
+                self.dump(root.trace_id)
+
+    def get_spans(self, trace_id=None) -> list:
+        with self._lock:
+            spans = list(self._spans)
+        return sorted((span for span in spans if trace_id in (None, span.trace_id)),
+                      key=lambda span: (span.start, span.depth))
+
+    def dump(self, trace_id):
+        spans = self.get_spans(trace_id)
+        root = next((span for span in spans if span.id == trace_id), None)
+        lines = [f'{"  " * span.depth}+{span.start - spans[0].start:.3f}s {span!r}'
+                 for span in spans]
+        logger.warning(f'Slow trace {root!r}, {len(spans)} spans:\n' + '\n'.join(lines))
+
+
+tracer = Tracer()
+
+
+def traced(name=None, attributes=None):
+    """
+    Decorator recording every call of a function or coroutine function as a span.
+
+    attributes is called with the same arguments and returns span attributes. Integer
+    results (0/1 check statuses) are saved as `result` attribute.
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        def start_span(args, kwargs):
+            return tracer.span(span_name, **(attributes(*args, **kwargs) if attributes else {}))
+
+        def save_result(span, result):
+            if isinstance(result, int):
+                span.attributes['result'] = result
+            return result
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(args, kwargs) as span:
+                    return save_result(span, await func(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(args, kwargs) as span:
+                return save_result(span, func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def traced_retry(retrying, name, func, *args, skale_call=True, **kwargs):
+    """
+    Calls func with tenacity retrying inside a span counting the attempts. Every
+    attempt of a SKALE Manager read is also counted in SKALE_CALLS exporter metric.
+    """
+    with tracer.span(name) as span:
+        def attempt():
+            span.attempts += 1
+            if skale_call:
+                SKALE_CALLS.inc(method=name, kind='call')
+            return func(*args, **kwargs)
+        return retrying.call(attempt)
@@ -0,0 +1,142 @@
+#   -*- coding: utf-8 -*-
+#
+#   This file is part of sla-agent
+#
+#   Copyright (C) 2020-Present SKALE Labs
+#
+#   sla-agent is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   sla-agent is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with sla-agent.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Ledger of verdicts sent to SKALE Manager.
+
+Verdicts are keyed on (node id, report date), so a verdict for the same node and epoch
+is never sent twice. The ledger is a JSON lines file, records are only appended and
+fsync'd: a verdict is written as pending before the transaction and as sent after it.
+A pending verdict without a sent record (agent stopped during the send) is not
+considered sent and is sent again, SKALE Manager moves report date of the node when
+the transaction succeeds, so the same key can't be reported twice. A record torn by a
+crash is cut off on load, other corrupted records are skipped. Old verdicts are pruned
+by rewriting the file atomically.
+
+Verdicts of the former sent_verdicts.json file have no report date and are not
+imported.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from configs import VERDICTS_LEDGER_FILEPATH
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+
+
+def fsync_dir(filepath):
+    fd = os.open(os.path.dirname(os.path.abspath(filepath)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def parse_record(line) -> dict:
+    """Decodes a ledger record, raises ValueError if it's not a valid one."""
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError(f'record is not an object: {record!r}')
+    if record.get('status') not in (PENDING, SENT):
+        raise ValueError(f'unknown status: {record.get("status")!r}')
+    for field in ('node_id', 'rep_date'):
+        if not isinstance(record.get(field), (int, str)):
+            raise ValueError(f'invalid {field}: {record.get(field)!r}')
+    return record
+
+
+class VerdictLedger:
+    def __init__(self, filepath=VERDICTS_LEDGER_FILEPATH):
+        self.filepath = filepath
+        self._records = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.filepath, 'rb') as ledger_file:
+                data = ledger_file.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            logger.warning(f'Cutting off torn record at the end of {self.filepath}')
+            with open(self.filepath, 'r+b') as ledger_file:
+                ledger_file.truncate(end)
+                os.fsync(ledger_file.fileno())
+        for number, line in enumerate(data[:end].splitlines(), 1):
+            try:
+                record = parse_record(line)
+            except ValueError as err:
+                logger.error(f'Skipping corrupted record {number} of {self.filepath}: {err!r}')
+                continue
+            self._records[(record['node_id'], record['rep_date'])] = record
+        pending = [key for key, record in self._records.items() if record['status'] == PENDING]
+        if pending:
+            logger.warning(f'Verdicts {pending} were not confirmed as sent, '
+                           f'they will be sent again')
+
+    def _append(self, records):
+        with open(self.filepath, 'a') as ledger_file:
+            ledger_file.write(''.join(json.dumps(record) + '\n' for record in records))
+            ledger_file.flush()
+            os.fsync(ledger_file.fileno())
+        for record in records:
+            self._records[(record['node_id'], record['rep_date'])] = record
+
+    def __len__(self):
+        return len(self._records)
+
+    def is_sent(self, node_id, rep_date) -> bool:
+        record = self._records.get((node_id, rep_date))
+        return record is not None and record['status'] == SENT
+
+    def add_pending(self, entries):
+        """Records verdicts about to be sent, entries are (node id, rep date, verdict)."""
+        with self._lock:
+            self._append([{'node_id': node_id, 'rep_date': rep_date, 'verdict': list(verdict),
+                           'status': PENDING} for node_id, rep_date, verdict in entries])
+
+    def mark_sent(self, keys):
+        """Records verdicts with (node id, rep date) keys as sent."""
+        with self._lock:
+            self._append([dict(self._records[key], status=SENT) for key in keys])
+
+    def prune(self, before) -> int:
+        """Removes verdicts with report date (unix time) before the given one."""
+        with self._lock:
+            kept = {key: record for key, record in self._records.items() if key[1] >= before}
+            removed = len(self._records) - len(kept)
+            if not removed:
+                return 0
+            tmp_filepath = self.filepath + '.tmp'
+            with open(tmp_filepath, 'w') as tmp_file:
+                tmp_file.write(''.join(json.dumps(record) + '\n' for record in kept.values()))
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_filepath, self.filepath)
+            fsync_dir(self.filepath)
+            self._records = kept
+            return removed